@@ -1,4 +1,5 @@
 import psycopg2
+from psycopg2 import sql
 import os
 
 DB_NAME = os.environ.get('PG_DB', 'botdb')
@@ -14,17 +15,12 @@ def drop_db_and_user():
     conn.autocommit = True
     cur = conn.cursor()
     # Отключаем пользователей от базы
-    cur.execute(f"SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s", (TARGET_DB_NAME,))
-    # Удаляем базу, если есть
-    cur.execute(f"SELECT 1 FROM pg_database WHERE datname=%s", (TARGET_DB_NAME,))
-    if cur.fetchone():
-        cur.execute(f"DROP DATABASE {TARGET_DB_NAME}")
-        print(f"Database {TARGET_DB_NAME} dropped.")
-    # Удаляем пользователя, если есть
-    cur.execute(f"SELECT 1 FROM pg_roles WHERE rolname=%s", (TARGET_DB_USER,))
-    if cur.fetchone():
-        cur.execute(f"DROP USER {TARGET_DB_USER}")
-        print(f"User {TARGET_DB_USER} dropped.")
+    cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s", (TARGET_DB_NAME,))
+    # Удаляем базу и пользователя, если есть
+    cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(TARGET_DB_NAME)))
+    print(f"Database {TARGET_DB_NAME} dropped.")
+    cur.execute(sql.SQL("DROP USER IF EXISTS {}").format(sql.Identifier(TARGET_DB_USER)))
+    print(f"User {TARGET_DB_USER} dropped.")
     cur.close()
     conn.close()
     print('All data, user, and db dropped.')
@@ -1,11 +1,15 @@
 import asyncio
+import bisect
 import json
 import aio_pika
 import logging
 import yaml
 import os
+import signal
+import copy
 import asyncpg
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 # Настройка логирования
@@ -15,21 +19,164 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Очередь найденных нарушений; параметры объявления совпадают с llm-src
+RULE_MATCH_QUEUE = "message-rule-match"
+
+# C-загрузчик libyaml, если PyYAML собран с ним
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Кэш разобранных YAML-файлов: путь -> (mtime, size, данные)
+_YAML_CACHE_MAX_SIZE = 100
+_yaml_cache: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+
+
+def _load_yaml_with_sidecar(path: str) -> Dict[str, Any]:
+    """Чтение YAML через JSON-копию рядом с ним (path + '.json'), если она не старше YAML."""
+    json_path = path + '.json'
+    try:
+        if os.path.getmtime(json_path) >= os.path.getmtime(path):
+            with open(json_path, 'rb') as f:
+                return json.loads(f.read())
+    except (OSError, ValueError):
+        pass
+    with open(path, 'r') as f:
+        data = yaml.load(f, Loader=_YamlLoader)
+    # Атомарно обновляем JSON-копию для следующих запусков
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, json_path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Failed to write config sidecar %s: %s", json_path, e)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return data
+
+
+def _load_yaml_cached(path: str) -> Dict[str, Any]:
+    """Загрузка YAML-файла с кэшированием по (mtime, size)."""
+    stat = os.stat(path)
+    cached = _yaml_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        _yaml_cache.move_to_end(path)
+        return copy.deepcopy(cached[2])
+    data = _load_yaml_with_sidecar(path)
+    _yaml_cache[path] = (stat.st_mtime, stat.st_size, data)
+    _yaml_cache.move_to_end(path)
+    if len(_yaml_cache) > _YAML_CACHE_MAX_SIZE:
+        _yaml_cache.popitem(last=False)
+    return copy.deepcopy(data)
+
+
+class AckBatcher:
+    """Пакетное подтверждение доставок через basic.ack(multiple=True).
+
+    Одним multiple-ack подтверждается только непрерывный префикс обработанных
+    доставок, чтобы не подтвердить сообщения, которые ещё обрабатываются
+    параллельно. Доставки, обработанные раньше более старых, подтверждаются
+    при сбросе по одной: незавершённая доставка не задерживает остальные.
+    """
+
+    def __init__(self, batch_size: int = 32, flush_interval: float = 0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # delivery_tag необработанных доставок по возрастанию
+        self._tags: List[int] = []
+        self._messages: Dict[int, aio_pika.IncomingMessage] = {}
+        # delivery_tag -> успешно ли обработано
+        self._settled: Dict[int, bool] = {}
+        self._last_ok = None
+        self._pending = 0
+
+    def track(self, message: aio_pika.IncomingMessage):
+        """Регистрация доставки до начала её обработки."""
+        bisect.insort(self._tags, message.delivery_tag)
+        self._messages[message.delivery_tag] = message
+
+    async def ack(self, message: aio_pika.IncomingMessage):
+        """Отметка об успешной обработке; ack уходит пачкой."""
+        self._settle(message, True)
+        if self._pending + len(self._settled) >= self.batch_size:
+            await self.flush()
+
+    async def reject(self, message: aio_pika.IncomingMessage, requeue: bool = False):
+        """Отклонение доставки; по умолчанию без возврата в очередь."""
+        self._settle(message, False)
+        await message.reject(requeue=requeue)
+
+    def _settle(self, message: aio_pika.IncomingMessage, ok: bool):
+        tag = message.delivery_tag
+        # Доставка канала, открытого до переподключения, - её тег мог уже
+        # достаться новому сообщению
+        if self._messages.get(tag) is not message:
+            return
+        self._settled[tag] = ok
+        while self._tags and self._tags[0] in self._settled:
+            head = self._tags.pop(0)
+            message = self._messages.pop(head)
+            # Отклонённые доставки уже закрыты, multiple-ack их не затронет
+            if self._settled.pop(head):
+                self._last_ok = message
+                self._pending += 1
+
+    async def flush(self):
+        """Подтверждение обработанных доставок: префикс - одним basic.ack, остальные - по одной."""
+        if self._last_ok is not None:
+            message, self._last_ok, self._pending = self._last_ok, None, 0
+            await message.ack(multiple=True)
+        if not self._settled:
+            return
+        # Обработанные доставки за ещё не завершённой: префикс может застрять
+        # на ней надолго, поэтому подтверждаем их без multiple
+        settled, self._settled = self._settled, {}
+        self._tags = [tag for tag in self._tags if tag not in settled]
+        to_ack = []
+        for tag, ok in settled.items():
+            message = self._messages.pop(tag)
+            # Отклонённые доставки уже закрыты
+            if ok:
+                to_ack.append(message)
+        for message in to_ack:
+            await message.ack()
+
+    def reset(self):
+        """Забыть доставки старого канала: подтвердить их уже нельзя."""
+        self._tags.clear()
+        self._messages.clear()
+        self._settled.clear()
+        self._last_ok = None
+        self._pending = 0
+
+    async def run(self):
+        """Периодический сброс неполной пачки."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush acks: %s", e)
+
+
 class RuleDecider:
     def __init__(self):
         self.config = self.load_config()
         self.db = None
         self.rabbitmq = None
         self.bot = None
+        self._stop = None
+        self.acker = AckBatcher()
 
     def load_config(self) -> Dict[str, Any]:
         """Загрузка конфигурации из config.yaml"""
         config_path = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
         try:
-            with open(config_path, 'r') as f:
-                return yaml.safe_load(f)
+            return _load_yaml_cached(config_path)
         except Exception as e:
-            logger.error(f"Failed to load config: {e}")
+            logger.error("Failed to load config: %s", e)
             raise
 
     async def init_db(self):
@@ -40,11 +187,16 @@ class RuleDecider:
                 port=self.config['postgres']['port'],
                 user=self.config['postgres']['user'],
                 password=self.config['postgres']['password'],
-                database=self.config['postgres']['db']
+                database=self.config['postgres']['db'],
+                min_size=self.config['postgres'].get('pool_min', 5),
+                max_size=self.config['postgres'].get('pool_max', 50),
+                max_inactive_connection_lifetime=300,
+                statement_cache_size=200,
+                max_cached_statement_lifetime=0
             )
             logger.info("Database connection established")
         except Exception as e:
-            logger.error(f"Failed to connect to database: {e}")
+            logger.error("Failed to connect to database: %s", e)
             raise
 
     async def init_rabbitmq(self):
@@ -57,9 +209,10 @@ class RuleDecider:
                 password=self.config['queue']['password'],
                 virtualhost=self.config['queue']['vhost']
             )
+            self.rabbitmq.reconnect_callbacks.add(self.on_reconnect)
             logger.info("RabbitMQ connection established")
         except Exception as e:
-            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            logger.error("Failed to connect to RabbitMQ: %s", e)
             raise
 
     async def init_bot(self):
@@ -69,158 +222,162 @@ class RuleDecider:
             self.bot = Bot(token=self.config['telegram']['bot_token'])
             logger.info("Bot initialized")
         except Exception as e:
-            logger.error(f"Failed to initialize bot: {e}")
+            logger.error("Failed to initialize bot: %s", e)
             raise
 
-    async def get_rule_info(self, rule_id: int) -> Dict[str, Any]:
-        """Получение информации о правиле"""
+    async def get_rule_context(self, rule_id: int) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Получение правила, модераторов его чата и их политик уведомлений одним запросом"""
         try:
             async with self.db.acquire() as conn:
-                rule = await conn.fetchrow(
+                rows = await conn.fetch(
                     """
-                    SELECT r.*, c.id as chat_id, c.title as chat_title
+                    SELECT r.id, r.rule_text, r.type, c.id AS chat_id, c.title AS chat_title,
+                           u.user_id, u.username, u.full_name, p.policy
                     FROM rules r
                     JOIN chats c ON r.chat_id = c.id
+                    LEFT JOIN chat_moderators cm ON cm.chat_id = c.id AND cm.activated = TRUE
+                    LEFT JOIN users u ON u.user_id = cm.user_id
+                    LEFT JOIN rule_violation_notification_policies p ON p.moderator_id = u.user_id
                     WHERE r.id = $1
                     """,
                     rule_id
                 )
-                if not rule:
-                    logger.error(f"Rule {rule_id} not found")
-                    return None
-                return dict(rule)
         except Exception as e:
-            logger.error(f"Failed to get rule info: {e}")
-            return None
+            logger.error("Failed to get rule context: %s", e)
+            return None, []
+        if not rows:
+            return None, []
 
-    async def get_moderators_for_chat(self, chat_id: int) -> list:
-        """Получение списка модераторов для чата"""
-        try:
-            async with self.db.acquire() as conn:
-                moderators = await conn.fetch(
-                    """
-                    SELECT DISTINCT u.user_id, u.username, u.full_name
-                    FROM users u
-                    JOIN chat_moderators cm ON u.user_id = cm.user_id
-                    WHERE cm.chat_id = $1 AND cm.activated = TRUE
-                    """,
-                    chat_id
-                )
-                return [dict(m) for m in moderators]
-        except Exception as e:
-            logger.error(f"Failed to get moderators: {e}")
-            return []
+        first = rows[0]
+        rule = {
+            'id': first['id'],
+            'rule_text': first['rule_text'],
+            'type': first['type'],
+            'chat_id': first['chat_id'],
+            'chat_title': first['chat_title'],
+        }
+        # Строки повторяются для каждой политики модератора - группируем по user_id
+        moderators: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            if row['user_id'] is None:
+                continue
+            moderator = moderators.get(row['user_id'])
+            if moderator is None:
+                moderator = moderators[row['user_id']] = {
+                    'user_id': row['user_id'],
+                    'username': row['username'],
+                    'full_name': row['full_name'],
+                    'policies': set(),
+                }
+            if row['policy'] is not None:
+                moderator['policies'].add(row['policy'])
+        return rule, list(moderators.values())
 
-    async def get_notification_policy(self, user_id: int) -> bool:
-        """Получение политики уведомлений модератора"""
-        try:
-            async with self.db.acquire() as conn:
-                policy = await conn.fetchval(
-                    """
-                    SELECT policy 
-                    FROM rule_violation_notification_policies 
-                    WHERE moderator_id = $1
-                    """,
-                    user_id
-                )
-                # Если политика не найдена, считаем что уведомления включены
-                return policy is None or policy in ('NOTIFY_BAN', 'NOTIFY_NOTIFICATION')
-        except Exception as e:
-            logger.error(f"Failed to get notification policy: {e}")
-            return True
+    def on_reconnect(self, *args):
+        """После переподключения каналы открыты заново и delivery_tag начинаются сначала."""
+        logger.warning("RabbitMQ connection restored, resetting pending acks")
+        self.acker.reset()
 
     async def process_rule_match(self, message: aio_pika.IncomingMessage):
         """Обработка совпадения правила"""
+        self.acker.track(message)
         try:
-            async with message.process():
-                data = json.loads(message.body.decode())
-                message_id = data['message_id']
-                rule_id = data['rule_id']
-                
-                logger.info(f"Processing rule match: message_id={message_id}, rule_id={rule_id}")
-                
-                # Получаем информацию о правиле
-                rule = await self.get_rule_info(rule_id)
-                if not rule:
-                    logger.error(f"Rule {rule_id} not found")
-                    return
-                
-                # Получаем список модераторов
-                moderators = await self.get_moderators_for_chat(rule['chat_id'])
-                if not moderators:
-                    logger.warning(f"No moderators found for chat {rule['chat_id']}")
-                    return
-                
-                logger.info(f"Found {len(moderators)} moderators for chat {rule['chat_id']}")
-                
-                # Уведомляем модераторов
-                for moderator in moderators:
-                    try:
-                        # Проверяем настройки уведомлений модератора
-                        should_notify = await self.get_notification_policy(moderator['user_id'])
-                        logger.info(f"Moderator {moderator['user_id']} notification policy: {should_notify}")
-                        
-                        if not should_notify:
-                            logger.info(f"Skipping notification for moderator {moderator['user_id']} due to notification policy")
-                            continue
-                        
-                        # Отправляем информацию о правиле и кнопки действий
-                        keyboard = []
-                        if rule['type'] == 'NOTIFY':
-                            keyboard.append([InlineKeyboardButton(text="Забанить", callback_data=f"violation_action:{message_id}:BAN")])
-                        else:
-                            keyboard.append([InlineKeyboardButton(text="Разбанить", callback_data=f"violation_action:{message_id}:UNBAN")])
-                        
-                        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-                        
-                        # Пересылаем сообщение
-                        try:
-                            await self.bot.forward_message(
-                                from_chat_id=rule['chat_id'],
-                                chat_id=moderator['user_id'],
-                                message_id=message_id
-                            )
-                            logger.info(f"Successfully forwarded message {message_id} to moderator {moderator['user_id']}")
-                        except Exception as e:
-                            logger.error(f"Failed to forward message to moderator {moderator['user_id']}: {e}")
-                        
-                        # Отправляем информацию о правиле
-                        await self.bot.send_message(
-                            moderator['user_id'],
-                            f"⚠️ Нарушение правила в чате {rule['chat_title']}:\n\n"
-                            f"Правило: {rule['rule_text']}\n"
-                            f"Тип: {rule['type']}",
-                            reply_markup=markup
-                        )
-                        logger.info(f"Successfully sent notification to moderator {moderator['user_id']}")
-                        
-                        # Если правило типа BAN, удаляем сообщение и баним пользователя
-                        if rule['type'] == 'BAN':
-                            try:
-                                # Удаляем сообщение
-                                await self.bot.delete_message(
-                                    chat_id=rule['chat_id'],
-                                    message_id=message_id
-                                )
-                                
-                                # Баним пользователя
-                                await self.bot.ban_chat_member(
-                                    chat_id=rule['chat_id'],
-                                    user_id=data['user_id']
-                                )
-                                
-                                logger.info(f"User {data['user_id']} banned and message {message_id} deleted in chat {rule['chat_id']}")
-                            except Exception as e:
-                                logger.error(f"Failed to ban user or delete message: {e}")
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to send notification to moderator {moderator['user_id']}: {e}")
-                
+            await self.handle_rule_match(json.loads(message.body.decode()))
         except Exception as e:
-            logger.error(f"Failed to process rule match: {e}")
+            logger.error("Failed to process rule match: %s", e)
+            await self.acker.reject(message)
+        else:
+            await self.acker.ack(message)
+
+    async def handle_rule_match(self, data: Dict[str, Any]):
+        """Уведомление модераторов о нарушении правила"""
+        message_id = data['message_id']
+        rule_id = data['rule_id']
+
+        logger.info("Processing rule match: message_id=%s, rule_id=%s", message_id, rule_id)
+
+        # Получаем правило и модераторов чата вместе с их политиками
+        rule, moderators = await self.get_rule_context(rule_id)
+        if not rule:
+            logger.error("Rule %s not found", rule_id)
+            return
+
+        if not moderators:
+            logger.warning("No moderators found for chat %s", rule['chat_id'])
+            return
+
+        logger.info("Found %s moderators for chat %s", len(moderators), rule['chat_id'])
+
+        # Кнопки действий одинаковы для всех модераторов
+        keyboard = []
+        if rule['type'] == 'NOTIFY':
+            keyboard.append([InlineKeyboardButton(text="Забанить", callback_data=f"violation_action:{message_id}:BAN")])
+        else:
+            keyboard.append([InlineKeyboardButton(text="Разбанить", callback_data=f"violation_action:{message_id}:UNBAN")])
+
+        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+        async def _notify_one(moderator: Dict[str, Any]) -> None:
+            try:
+                # Проверяем настройки уведомлений модератора;
+                # если политика не найдена, считаем что уведомления включены
+                policies = moderator['policies']
+                should_notify = not policies or bool(policies & {'NOTIFY_BAN', 'NOTIFY_NOTIFICATION'})
+                logger.info("Moderator %s notification policy: %s", moderator['user_id'], should_notify)
+
+                if not should_notify:
+                    logger.info("Skipping notification for moderator %s due to notification policy", moderator['user_id'])
+                    return
+
+                # Пересылаем сообщение
+                try:
+                    await self.bot.forward_message(
+                        from_chat_id=rule['chat_id'],
+                        chat_id=moderator['user_id'],
+                        message_id=message_id
+                    )
+                    logger.info("Successfully forwarded message %s to moderator %s", message_id, moderator['user_id'])
+                except Exception as e:
+                    logger.error("Failed to forward message to moderator %s: %s", moderator['user_id'], e)
+
+                # Отправляем информацию о правиле
+                await self.bot.send_message(
+                    moderator['user_id'],
+                    f"⚠️ Нарушение правила в чате {rule['chat_title']}:\n\n"
+                    f"Правило: {rule['rule_text']}\n"
+                    f"Тип: {rule['type']}",
+                    reply_markup=markup
+                )
+                logger.info("Successfully sent notification to moderator %s", moderator['user_id'])
+            except Exception as e:
+                logger.error("Failed to send notification to moderator %s: %s", moderator['user_id'], e)
+
+        # Уведомляем модераторов параллельно
+        await asyncio.gather(*(_notify_one(m) for m in moderators), return_exceptions=True)
+
+        # Если правило типа BAN, удаляем сообщение и баним пользователя.
+        # Делаем это один раз и после пересылки, иначе пересылать будет нечего.
+        if rule['type'] == 'BAN':
+            try:
+                # Удаляем сообщение
+                await self.bot.delete_message(
+                    chat_id=rule['chat_id'],
+                    message_id=message_id
+                )
+
+                # Баним пользователя
+                await self.bot.ban_chat_member(
+                    chat_id=rule['chat_id'],
+                    user_id=data['user_id']
+                )
+
+                logger.info("User %s banned and message %s deleted in chat %s", data['user_id'], message_id, rule['chat_id'])
+            except Exception as e:
+                logger.error("Failed to ban user or delete message: %s", e)
 
     async def start(self):
         """Запуск сервиса"""
+        ack_task = None
         try:
             # Инициализация подключений
             await self.init_db()
@@ -229,26 +386,38 @@ class RuleDecider:
             
             # Создание канала
             channel = await self.rabbitmq.channel()
+            await channel.set_qos(prefetch_count=self.config['queue'].get('prefetch', 50))
             
             # Объявление очереди
             queue = await channel.declare_queue(
-                "message-rule-match",
+                RULE_MATCH_QUEUE,
                 durable=True
             )
             
             # Начало прослушивания очереди
             await queue.consume(self.process_rule_match)
+            ack_task = asyncio.create_task(self.acker.run())
             
             logger.info("Service started successfully")
             
-            # Бесконечный цикл для поддержания работы сервиса
-            while True:
-                await asyncio.sleep(1)
-                
+            # Ждём сигнала остановки, не просыпаясь в простое
+            self._stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, self._stop.set)
+            await self._stop.wait()
+            logger.info("Shutdown signal received, stopping service")
+
         except Exception as e:
-            logger.error(f"Service failed: {e}")
+            logger.error("Service failed: %s", e)
             raise
         finally:
+            if ack_task:
+                ack_task.cancel()
+                try:
+                    await self.acker.flush()
+                except Exception as e:
+                    logger.error("Failed to flush acks: %s", e)
             if self.db:
                 await self.db.close()
             if self.rabbitmq:
@@ -1,4 +1,5 @@
 import psycopg2
+from psycopg2 import errors, sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import os
 import asyncio
@@ -17,14 +18,20 @@ def create_db_and_user():
     conn = psycopg2.connect(dbname='postgres', user='postgres', host=DB_HOST, port=DB_PORT)
     conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
     cur = conn.cursor()
-    cur.execute(f"SELECT 1 FROM pg_roles WHERE rolname=%s", (DB_USER,))
-    if not cur.fetchone():
-        cur.execute(f"CREATE USER {DB_USER} WITH PASSWORD %s", (DB_PASS,))
-        print(f"User {DB_USER} created.")
-    cur.execute(f"SELECT 1 FROM pg_database WHERE datname=%s", (DB_NAME,))
-    if not cur.fetchone():
-        cur.execute(f"CREATE DATABASE {DB_NAME} OWNER {DB_USER}")
+    # Создаём пользователя одним запросом, если он уже есть - ничего не делаем
+    cur.execute(sql.SQL(
+        "DO $$ BEGIN CREATE USER {} WITH PASSWORD {}; "
+        "EXCEPTION WHEN duplicate_object THEN NULL; END $$"
+    ).format(sql.Identifier(DB_USER), sql.Literal(DB_PASS)))
+    print(f"User {DB_USER} is ready.")
+    # CREATE DATABASE нельзя выполнить внутри DO, поэтому ловим ошибку дубликата
+    try:
+        cur.execute(sql.SQL("CREATE DATABASE {} OWNER {}").format(
+            sql.Identifier(DB_NAME), sql.Identifier(DB_USER)
+        ))
         print(f"Database {DB_NAME} created.")
+    except errors.DuplicateDatabase:
+        pass
     cur.close()
     conn.close()
 
@@ -32,12 +39,9 @@ def run_sql_file():
     conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
     cur = conn.cursor()
     with open(SQL_FILE, 'r', encoding='utf-8') as f:
-        sql = f.read()
-    # psycopg2 не поддерживает выполнение нескольких команд сразу, разбиваем по ';'
-    for statement in sql.split(';'):
-        stmt = statement.strip()
-        if stmt:
-            cur.execute(stmt)
+        script = f.read()
+    # Весь скрипт уходит одним запросом: libpq сам выполняет несколько команд
+    cur.execute(script)
     conn.commit()
     cur.close()
     conn.close()
@@ -1,255 +1,464 @@
 import asyncio
-import json
+import bisect
+import functools
+import orjson
 import aio_pika
-from typing import Dict, Any, Set
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import yaml
 import os
-from collections import defaultdict
+import time
+from dataclasses import dataclass, field
+from operator import itemgetter
 
 # Настройка логирования
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# C-загрузчик libyaml, если PyYAML собран с ним
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+
+# Входные очереди и вид данных, который приходит из каждой
+INPUT_QUEUES = (
+    ("multimedia.images", 'images'),
+    ("prompt.transcribed-audio", 'transcribed_audio'),
+    ("multimedia.text", 'text'),
+)
+
+
+# Очередь, в которую уходит собранная информация
+READY_INFO_QUEUE = "prompt.ready_info"
+
+# Число обработчиков публикации, размер очереди собранных сообщений и пачки публикаций
+DISPATCH_WORKERS = 4
+DISPATCH_QUEUE_SIZE = 1000
+DISPATCH_BATCH_SIZE = 32
+
+# Время жизни несобранной записи и период её поиска, в секундах
+ENTRY_TTL = 600
+SWEEP_INTERVAL = 60
+
+# Метаданные, которые бот и транскрибатор кладут в каждый фрагмент
+_METADATA_FIELDS = itemgetter('chat_id', 'has_video', 'has_photo', 'has_audio', 'image_uuids', 'audio_uuids')
+
+# Биты видов данных в масках полученных и требуемых фрагментов
+KIND_BITS = {'images': 1, 'transcribed_audio': 2, 'text': 4}
+
+
+def _required_mask(has_video: bool, has_photo: bool, has_audio: bool, has_text: bool) -> int:
+    """Маска видов данных, которые нужно дождаться для сообщения с такими признаками."""
+    mask = 0
+    if has_video:
+        mask |= KIND_BITS['images'] | KIND_BITS['transcribed_audio']
+    if has_photo:
+        mask |= KIND_BITS['images']
+    if has_audio:
+        mask |= KIND_BITS['transcribed_audio']
+    if has_text:
+        mask |= KIND_BITS['text']
+    return mask
+
+
+# Все 16 сочетаний признаков; индекс: бит 0 - видео, 1 - фото, 2 - аудио, 3 - текст
+_REQUIRED_TABLE = tuple(
+    _required_mask(bool(i & 1), bool(i & 2), bool(i & 4), bool(i & 8)) for i in range(16)
+)
+
+
+@dataclass(frozen=True, slots=True)
+class QueueConfig:
+    """Параметры подключения к RabbitMQ из секции queue."""
+    host: str
+    port: int
+    username: str
+    password: str
+    vhost: str
+    prefetch: int = 500
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QueueConfig':
+        return cls(
+            host=data['host'],
+            port=data['port'],
+            username=data['username'],
+            password=data['password'],
+            vhost=data['vhost'],
+            prefetch=data.get('prefetch', 500)
+        )
+
+
+@dataclass(slots=True)
+class MsgEntry:
+    """Собранные по одному сообщению данные из входных очередей."""
+    images: Optional[Dict[str, Any]] = None
+    transcribed_audio: Optional[Dict[str, Any]] = None
+    text: Optional[Dict[str, Any]] = None
+    message_id: Optional[int] = None
+    chat_id: Optional[int] = None
+    has_video: bool = False
+    has_photo: bool = False
+    has_audio: bool = False
+    image_uuids: List[str] = field(default_factory=list)
+    audio_uuids: List[str] = field(default_factory=list)
+    received_mask: int = 0
+    required_mask: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    # Доставки фрагментов (вид, сообщение): подтверждаются только после публикации
+    deliveries: List[Tuple[str, aio_pika.IncomingMessage]] = field(default_factory=list)
+
+
+class AckBatcher:
+    """Пакетное подтверждение доставок через basic.ack(multiple=True).
+
+    Одним multiple-ack подтверждается только непрерывный префикс обработанных
+    доставок, чтобы не подтвердить сообщения, которые ещё обрабатываются
+    параллельно. Доставки, обработанные раньше более старых, подтверждаются
+    при сбросе по одной: незавершённая доставка не задерживает остальные.
+    """
+
+    def __init__(self, batch_size: int = 32, flush_interval: float = 0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # delivery_tag необработанных доставок по возрастанию
+        self._tags: List[int] = []
+        self._messages: Dict[int, aio_pika.IncomingMessage] = {}
+        # delivery_tag -> успешно ли обработано
+        self._settled: Dict[int, bool] = {}
+        self._last_ok = None
+        self._pending = 0
+
+    def track(self, message: aio_pika.IncomingMessage):
+        """Регистрация доставки до начала её обработки."""
+        bisect.insort(self._tags, message.delivery_tag)
+        self._messages[message.delivery_tag] = message
+
+    async def ack(self, message: aio_pika.IncomingMessage):
+        """Отметка об успешной обработке; ack уходит пачкой."""
+        self._settle(message, True)
+        if self._pending + len(self._settled) >= self.batch_size:
+            await self.flush()
+
+    async def reject(self, message: aio_pika.IncomingMessage, requeue: bool = False):
+        """Отклонение доставки; по умолчанию без возврата в очередь."""
+        self._settle(message, False)
+        await message.reject(requeue=requeue)
+
+    def _settle(self, message: aio_pika.IncomingMessage, ok: bool):
+        tag = message.delivery_tag
+        # Доставка канала, открытого до переподключения, - её тег мог уже
+        # достаться новому сообщению
+        if self._messages.get(tag) is not message:
+            return
+        self._settled[tag] = ok
+        while self._tags and self._tags[0] in self._settled:
+            head = self._tags.pop(0)
+            message = self._messages.pop(head)
+            # Отклонённые доставки уже закрыты, multiple-ack их не затронет
+            if self._settled.pop(head):
+                self._last_ok = message
+                self._pending += 1
+
+    async def flush(self):
+        """Подтверждение обработанных доставок: префикс - одним basic.ack, остальные - по одной."""
+        if self._last_ok is not None:
+            message, self._last_ok, self._pending = self._last_ok, None, 0
+            await message.ack(multiple=True)
+        if not self._settled:
+            return
+        # Обработанные доставки за ещё не завершённой: префикс может застрять
+        # на ней надолго, поэтому подтверждаем их без multiple
+        settled, self._settled = self._settled, {}
+        self._tags = [tag for tag in self._tags if tag not in settled]
+        to_ack = []
+        for tag, ok in settled.items():
+            message = self._messages.pop(tag)
+            # Отклонённые доставки уже закрыты
+            if ok:
+                to_ack.append(message)
+        for message in to_ack:
+            await message.ack()
+
+    def reset(self):
+        """Забыть доставки старого канала: подтвердить их уже нельзя."""
+        self._tags.clear()
+        self._messages.clear()
+        self._settled.clear()
+        self._last_ok = None
+        self._pending = 0
+
+    async def run(self):
+        """Периодический сброс неполной пачки."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush acks: %s", e)
+
+
 class InfoPreparator:
     def __init__(self):
         self.rabbitmq_connection = None
         self.rabbitmq_channel = None
+        self.publish_channel = None
+        # Собранные сообщения, ожидающие публикации; создаётся в start()
+        self.dispatch_queue = None
+        # Подтверждения идут пачками отдельно по каждому каналу: delivery_tag у каналов свои
+        self.ackers = {kind: AckBatcher() for _, kind in INPUT_QUEUES}
         self.config = self.load_config()
+        self.queue_config = QueueConfig.from_dict(self.config['queue'])
+        q = self.queue_config
+        self.amqp_url = f"amqp://{q.username}:{q.password}@{q.host}:{q.port}/{q.vhost}"
         
         # Хранилище для собранной информации
-        self.message_data = defaultdict(lambda: {
-            'images': None,
-            'transcribed_audio': None,
-            'text': None,
-            'message_id': None,
-            'has_video': False,
-            'has_photo': False,
-            'has_audio': False,
-            'image_uuids': [],
-            'audio_uuids': []
-        })
-        
-        # Множества для отслеживания подтверждений
-        self.pending_confirmations = defaultdict(set)
+        self.message_data: Dict[int, MsgEntry] = {}
 
     def load_config(self) -> Dict[str, Any]:
         """Загрузка конфигурации из файла."""
         config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.yaml')
-        logger.info(f"Loading configuration from {config_path}")
+        logger.info("Loading configuration from %s", config_path)
         try:
             with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_YamlLoader)
             logger.info("Configuration loaded successfully")
             return config
         except Exception as e:
-            logger.error(f"Error loading configuration: {str(e)}")
+            logger.error("Error loading configuration: %s", e)
             raise
 
     async def init_rabbitmq(self):
         """Инициализация подключения к RabbitMQ."""
         logger.info("Connecting to RabbitMQ...")
-        queue_config = self.config['queue']
+        # Heartbeat позволяет заметить зависший сокет раньше, чем брокер
+        # закроет соединение и переотправит весь бэклог
         self.rabbitmq_connection = await aio_pika.connect_robust(
-            f"amqp://{queue_config['username']}:{queue_config['password']}@{queue_config['host']}:{queue_config['port']}/{queue_config['vhost']}"
+            self.amqp_url,
+            heartbeat=30,
+            reconnect_interval=5,
+            timeout=10
         )
+        self.rabbitmq_connection.reconnect_callbacks.add(self.on_reconnect)
         self.rabbitmq_channel = await self.rabbitmq_connection.channel()
+        # Отдельный канал для публикации, чтобы отправка не делила канал с
+        # потреблением. Фрагменты подтверждаются только после публикации,
+        # поэтому ждём подтверждения брокера: иначе успехом считалась бы
+        # запись в сокет
+        self.publish_channel = await self.rabbitmq_connection.channel()
         logger.info("Connected to RabbitMQ successfully")
 
-    async def process_images_message(self, message: aio_pika.IncomingMessage):
-        """Обработка сообщения из очереди multimedia.images."""
-        try:
-            body = message.body.decode()
-            data = json.loads(body)
-            message_id = data.get('message_id')
-            
-            logger.info(f"Received images message for message_id: {message_id}")
-            
-            # Сохраняем данные
-            self.message_data[message_id].update({
-                'images': data,
-                'message_id': message_id,
-                'has_video': data.get('has_video', False),
-                'has_photo': data.get('has_photo', False),
-                'has_audio': data.get('has_audio', False),
-                'image_uuids': data.get('image_uuids', []),
-                'audio_uuids': data.get('audio_uuids', [])
-            })
-            
-            # Добавляем в ожидающие подтверждения
-            self.pending_confirmations[message_id].add('images')
-            
-            # Проверяем, можно ли отправить собранную информацию
-            await self.check_and_send_info(message_id)
-            
-        except Exception as e:
-            logger.error(f"Error processing images message: {str(e)}")
-            raise
+    async def sweep_stale_entries(self):
+        """Периодическое удаление записей, фрагменты которых так и не пришли."""
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            deadline = time.monotonic() - ENTRY_TTL
+            stale = [mid for mid, entry in self.message_data.items() if entry.created_at < deadline]
+            for mid in stale:
+                entry = self.message_data.pop(mid)
+                logger.warning(
+                    "Dropping incomplete message %s: received mask %s, required mask %s",
+                    mid, entry.received_mask, entry.required_mask
+                )
+                # Недостающий фрагмент уже не придёт - отклоняем полученные,
+                # иначе они бесконечно занимали бы окно prefetch
+                await self.settle_deliveries(entry, ok=False)
 
-    async def process_transcribed_audio_message(self, message: aio_pika.IncomingMessage):
-        """Обработка сообщения из очереди prompt.transcribed-audio."""
+    async def declare_queue(self, channel: aio_pika.abc.AbstractChannel, name: str):
+        """Объявление очереди: сначала пассивная проверка, полное объявление - только если её нет."""
         try:
-            body = message.body.decode()
-            data = json.loads(body)
-            message_id = data.get('message_id')
-            
-            logger.info(f"Received transcribed audio message for message_id: {message_id}")
-            
-            # Сохраняем данные
-            self.message_data[message_id].update({
-                'transcribed_audio': data,
-                'message_id': message_id,
-                'has_video': data.get('has_video', False),
-                'has_photo': data.get('has_photo', False),
-                'has_audio': data.get('has_audio', False),
-                'image_uuids': data.get('image_uuids', []),
-                'audio_uuids': data.get('audio_uuids', [])
-            })
-            
-            # Добавляем в ожидающие подтверждения
-            self.pending_confirmations[message_id].add('transcribed_audio')
-            
-            # Проверяем, можно ли отправить собранную информацию
-            await self.check_and_send_info(message_id)
-            
-        except Exception as e:
-            logger.error(f"Error processing transcribed audio message: {str(e)}")
-            raise
+            return channel, await channel.declare_queue(name, passive=True)
+        except aio_pika.exceptions.ChannelClosed:
+            # Неудачная пассивная проверка закрывает канал, объявляем на новом
+            channel = await self.rabbitmq_connection.channel()
+            return channel, await channel.declare_queue(name, durable=True)
+
+    def on_reconnect(self, *args):
+        """После переподключения каналы открыты заново и delivery_tag начинаются сначала."""
+        logger.warning("RabbitMQ connection restored, resetting pending acks")
+        for acker in self.ackers.values():
+            acker.reset()
 
-    async def process_text_message(self, message: aio_pika.IncomingMessage):
-        """Обработка сообщения из очереди multimedia.text."""
+    async def process_message(self, kind: str, message: aio_pika.IncomingMessage):
+        """Обработка сообщения из входной очереди; kind - вид данных (images, transcribed_audio, text)."""
+        acker = self.ackers[kind]
+        acker.track(message)
         try:
-            body = message.body.decode()
-            data = json.loads(body)
+            data = orjson.loads(message.body)
             message_id = data.get('message_id')
             
-            logger.info(f"Received text message for message_id: {message_id}")
+            logger.info("Received %s message for message_id: %s", kind, message_id)
             
             # Сохраняем данные
-            self.message_data[message_id].update({
-                'text': data,
-                'message_id': message_id,
-                'has_video': data.get('has_video', False),
-                'has_photo': data.get('has_photo', False),
-                'has_audio': data.get('has_audio', False),
-                'image_uuids': data.get('image_uuids', []),
-                'audio_uuids': data.get('audio_uuids', [])
-            })
+            entry = self.message_data.get(message_id)
+            if entry is None:
+                entry = self.message_data[message_id] = MsgEntry()
+            setattr(entry, kind, data)
+            # Метаданные одинаковы во всех фрагментах сообщения - берём из первого
+            if entry.message_id is None:
+                entry.message_id = message_id
+                (entry.chat_id, entry.has_video, entry.has_photo, entry.has_audio,
+                 entry.image_uuids, entry.audio_uuids) = _METADATA_FIELDS(data)
+                entry.required_mask = _REQUIRED_TABLE[
+                    bool(entry.has_video)
+                    | bool(entry.has_photo) << 1
+                    | bool(entry.has_audio) << 2
+                    | bool(data.get('text')) << 3
+                ]
+            elif data.get('text'):
+                # Фрагмент от транскрибатора не несёт текста, поэтому текст
+                # может стать известен только с более поздним фрагментом
+                entry.required_mask |= KIND_BITS['text']
             
-            # Добавляем в ожидающие подтверждения
-            self.pending_confirmations[message_id].add('text')
+            # Отмечаем полученный фрагмент; ack отложен до публикации собранного сообщения
+            entry.received_mask |= KIND_BITS[kind]
+            entry.deliveries.append((kind, message))
             
             # Проверяем, можно ли отправить собранную информацию
             await self.check_and_send_info(message_id)
             
         except Exception as e:
-            logger.error(f"Error processing text message: {str(e)}")
+            logger.error("Error processing %s message: %s", kind, e)
+            await acker.reject(message)
             raise
 
+    async def settle_deliveries(self, entry: MsgEntry, ok: bool, requeue: bool = False):
+        """Подтверждение или отклонение всех фрагментов записи, каждого - в своём канале."""
+        for kind, message in entry.deliveries:
+            acker = self.ackers[kind]
+            try:
+                if ok:
+                    await acker.ack(message)
+                else:
+                    await acker.reject(message, requeue=requeue)
+            except Exception as e:
+                # Канал мог закрыться: брокер сам вернёт неподтверждённую доставку
+                logger.error("Failed to settle %s fragment of message %s: %s", kind, entry.message_id, e)
+
     async def check_and_send_info(self, message_id: int):
-        """Проверяет, собраны ли все данные для сообщения, и отправляет их если да."""
-        data = self.message_data[message_id]
-        print("Данные: ", data)
-        pending = self.pending_confirmations[message_id]
-        
-        # Проверяем, что у нас есть все необходимые данные
-        required_data = set()
-        if data['has_video']:
-            required_data.add('images')
-            required_data.add('transcribed_audio')
-        if data['has_photo']:
-            required_data.add('images')
-        if data['has_audio']:
-            required_data.add('transcribed_audio')
-        if data['text']:
-            required_data.add('text')
-            
-        logger.info(f"Message {message_id} - Required data: {required_data}, Pending: {pending}")
+        """Проверяет, собраны ли все данные для сообщения, и ставит их в очередь на отправку."""
+        # Обращение не должно заново создавать уже отправленную и удалённую запись
+        data = self.message_data.get(message_id)
+        if data is None:
+            return
+
+        logger.info("Message %s - Required mask: %s, Received mask: %s", message_id, data.required_mask, data.received_mask)
         
         # Если все необходимые данные собраны
-        if required_data.issubset(pending):
-            logger.info(f"All required data collected for message {message_id}, sending to prompt.ready_info")
-            
-            # Формируем итоговое сообщение
-            result_message = {
-                'message_id': message_id,
-                'chat_id': data[next(iter(required_data))]['chat_id'],
-                'has_video': data['has_video'],
-                'has_photo': data['has_photo'],
-                'has_audio': data['has_audio'],
-                'image_uuids': data['image_uuids'],
-                'audio_uuids': data['audio_uuids'],
-                'transcribed_text': data['transcribed_audio']['transcribed_text'] if data['transcribed_audio'] else None,
-                'text': data['text']['text'] if data['text'] else None
-            }
-            print("Отправляем в очередь: ", result_message)
-            
-            # Отправляем в очередь
-            await self.rabbitmq_channel.default_exchange.publish(
-                aio_pika.Message(body=json.dumps(result_message).encode()),
-                routing_key="prompt.ready_info"
+        if (data.received_mask & data.required_mask) == data.required_mask:
+            logger.info("All required data collected for message %s, sending to prompt.ready_info", message_id)
+            # Снимаем запись сразу, чтобы повторный фрагмент не отправил её ещё раз
+            self.message_data.pop(message_id, None)
+            await self.dispatch_queue.put(data)
+
+    async def send_ready_info(self, data: MsgEntry):
+        """Отправка собранной информации в очередь prompt.ready_info."""
+        # Формируем итоговое сообщение
+        result_message = {
+            'message_id': data.message_id,
+            'chat_id': data.chat_id,
+            'has_video': data.has_video,
+            'has_photo': data.has_photo,
+            'has_audio': data.has_audio,
+            'image_uuids': data.image_uuids,
+            'audio_uuids': data.audio_uuids,
+            'transcribed_text': data.transcribed_audio['transcribed_text'] if data.transcribed_audio else None,
+            'text': data.text['text'] if data.text else None
+        }
+        logger.debug("Ready info for message %s: %r", data.message_id, result_message)
+        
+        # Отправляем в очередь
+        await self.publish_channel.default_exchange.publish(
+            aio_pika.Message(body=orjson.dumps(result_message)),
+            routing_key=READY_INFO_QUEUE
+        )
+        
+        logger.info("Successfully sent and cleaned up data for message %s", data.message_id)
+
+    async def dispatch_worker(self):
+        """Обработчик очереди отправки: публикует собранные сообщения пачками, не задерживая потребителей."""
+        while True:
+            # Ждём первое сообщение и забираем то, что уже накопилось следом
+            batch = [await self.dispatch_queue.get()]
+            while len(batch) < DISPATCH_BATCH_SIZE and not self.dispatch_queue.empty():
+                batch.append(self.dispatch_queue.get_nowait())
+            results = await asyncio.gather(
+                *(self.send_ready_info(data) for data in batch),
+                return_exceptions=True
             )
-            
-            # Очищаем данные с проверкой на существование
-            try:
-                del self.message_data[message_id]
-                logger.info(f"Removed message data for {message_id}")
-            except KeyError:
-                logger.warning(f"Message data for {message_id} was already removed")
-                
-            try:
-                del self.pending_confirmations[message_id]
-                logger.info(f"Removed pending confirmations for {message_id}")
-            except KeyError:
-                logger.warning(f"Pending confirmations for {message_id} were already removed")
-            
-            logger.info(f"Successfully sent and cleaned up data for message {message_id}")
+            for data, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error("Error sending ready info for message %s: %s", data.message_id, result)
+                    # Возвращаем фрагменты в очереди: после повторной доставки
+                    # сообщение соберётся и будет отправлено ещё раз
+                    await self.settle_deliveries(data, ok=False, requeue=True)
+                else:
+                    await self.settle_deliveries(data, ok=True)
+                self.dispatch_queue.task_done()
 
     async def start(self):
         """Запуск сервиса подготовки информации."""
+        ack_tasks = []
+        dispatch_tasks = []
+        sweep_task = None
         try:
             # Инициализация RabbitMQ
             await self.init_rabbitmq()
 
-            # Создаем очереди
-            images_queue = await self.rabbitmq_channel.declare_queue(
-                "multimedia.images",
-                durable=True
-            )
-            
-            transcribed_audio_queue = await self.rabbitmq_channel.declare_queue(
-                "prompt.transcribed-audio",
-                durable=True
-            )
-            
-            text_queue = await self.rabbitmq_channel.declare_queue(
-                "multimedia.text",
-                durable=True
-            )
+            # Публикацию выполняют отдельные обработчики; ограниченная очередь
+            # притормаживает потребителей, если отправка не успевает
+            self.dispatch_queue = asyncio.Queue(maxsize=DISPATCH_QUEUE_SIZE)
+            dispatch_tasks = [asyncio.create_task(self.dispatch_worker()) for _ in range(DISPATCH_WORKERS)]
+
+            # Каждая входная очередь получает свой канал: кадры доставки не
+            # сериализуются через один канал, а окно prefetch у каждой своё.
+            # Окно ограничивает бэклог, который копится в памяти процесса.
+            # Фрагменты не подтверждаются, пока сообщение не собрано и не
+            # отправлено, поэтому окно должно вмещать сообщения, чьи фрагменты
+            # разошлись по очередям (например, пока идёт транскрибация);
+            # записи, застрявшие дольше ENTRY_TTL, освобождает sweep
+            prefetch = self.queue_config.prefetch
+            input_queues = []
+            for queue_name, kind in INPUT_QUEUES:
+                channel = await self.rabbitmq_connection.channel()
+                channel, queue = await self.declare_queue(channel, queue_name)
+                await channel.set_qos(prefetch_count=prefetch)
+                input_queues.append((queue, kind))
             
-            ready_info_queue = await self.rabbitmq_channel.declare_queue(
-                "prompt.ready_info",
-                durable=True
-            )
+            # Без очереди default exchange молча отбросит сообщение, поэтому
+            # убеждаемся, что она есть, даже если llm ещё не запущен
+            self.rabbitmq_channel, _ = await self.declare_queue(self.rabbitmq_channel, READY_INFO_QUEUE)
             
             logger.info("All queues declared successfully")
 
             # Начинаем прослушивание очередей
             logger.info("Starting to listen to queues...")
-            await images_queue.consume(self.process_images_message, no_ack=True)
-            await transcribed_audio_queue.consume(self.process_transcribed_audio_message, no_ack=True)
-            await text_queue.consume(self.process_text_message, no_ack=True)
+            for queue, kind in input_queues:
+                await queue.consume(functools.partial(self.process_message, kind))
+            ack_tasks = [asyncio.create_task(acker.run()) for acker in self.ackers.values()]
+            sweep_task = asyncio.create_task(self.sweep_stale_entries())
 
             # Держим соединение активным
             await asyncio.Future()
 
         except Exception as e:
-            logger.error(f"Error in info preparator service: {str(e)}")
+            logger.error("Error in info preparator service: %s", e)
             raise
         finally:
+            for task in ack_tasks + dispatch_tasks:
+                task.cancel()
+            if sweep_task:
+                sweep_task.cancel()
+            for acker in self.ackers.values():
+                try:
+                    await acker.flush()
+                except Exception as e:
+                    logger.error("Failed to flush acks: %s", e)
             if self.rabbitmq_connection:
                 await self.rabbitmq_connection.close()
 
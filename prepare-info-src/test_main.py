@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+
+import orjson
+
+from main import AckBatcher, InfoPreparator, INPUT_QUEUES
+
+
+class FakeMessage:
+    """Доставка с тем же интерфейсом подтверждения, что у aio_pika.IncomingMessage."""
+
+    def __init__(self, delivery_tag: int, body: bytes = b''):
+        self.delivery_tag = delivery_tag
+        self.body = body
+        self.acks = []
+        self.rejected = None
+
+    async def ack(self, multiple: bool = False):
+        self.acks.append(multiple)
+
+    async def reject(self, requeue: bool = False):
+        self.rejected = requeue
+
+
+def _fragment(delivery_tag: int, message_id: int, text: str, has_audio: bool = False) -> FakeMessage:
+    return FakeMessage(delivery_tag, orjson.dumps({
+        'message_id': message_id,
+        'chat_id': 1,
+        'has_video': False,
+        'has_photo': False,
+        'has_audio': has_audio,
+        'image_uuids': [],
+        'audio_uuids': ['a'] if has_audio else [],
+        'text': text,
+    }))
+
+
+class AckBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_in_order_deliveries_are_acked_with_one_multiple_ack(self):
+        acker = AckBatcher()
+        messages = [FakeMessage(tag) for tag in (1, 2, 3)]
+        for message in messages:
+            acker.track(message)
+        for message in messages:
+            await acker.ack(message)
+        await acker.flush()
+
+        self.assertEqual([m.acks for m in messages], [[], [], [True]])
+
+    async def test_unsettled_delivery_does_not_hold_later_acks(self):
+        acker = AckBatcher()
+        stuck, later = FakeMessage(1), [FakeMessage(2), FakeMessage(3)]
+        for message in [stuck] + later:
+            acker.track(message)
+        for message in later:
+            await acker.ack(message)
+        await acker.flush()
+
+        self.assertEqual(stuck.acks, [])
+        self.assertEqual([m.acks for m in later], [[False], [False]])
+
+        # Застрявшая доставка в итоге подтверждается сама по себе
+        await acker.ack(stuck)
+        await acker.flush()
+        self.assertEqual(stuck.acks, [True])
+
+
+class StrandedFragmentTest(unittest.IsolatedAsyncioTestCase):
+    def make_preparator(self) -> InfoPreparator:
+        # Без load_config: конфигурация и RabbitMQ для сборки не нужны
+        preparator = InfoPreparator.__new__(InfoPreparator)
+        preparator.ackers = {kind: AckBatcher() for _, kind in INPUT_QUEUES}
+        preparator.message_data = {}
+        preparator.dispatch_queue = asyncio.Queue()
+        return preparator
+
+    async def test_later_text_messages_are_acked_while_fragment_waits_for_transcription(self):
+        preparator = self.make_preparator()
+        # Текст сообщения с аудио ждёт транскрибации, которая не приходит
+        stranded = _fragment(1, message_id=100, text="голосовое", has_audio=True)
+        later = [_fragment(tag, message_id=100 + tag, text="текст") for tag in (2, 3, 4)]
+
+        for message in [stranded] + later:
+            await preparator.process_message('text', message)
+        # Публикуем собранные сообщения так же, как dispatch_worker
+        while not preparator.dispatch_queue.empty():
+            entry = preparator.dispatch_queue.get_nowait()
+            await preparator.settle_deliveries(entry, ok=True)
+        await preparator.ackers['text'].flush()
+
+        self.assertIn(100, preparator.message_data)
+        self.assertEqual(stranded.acks, [])
+        self.assertIsNone(stranded.rejected)
+        self.assertEqual([m.acks for m in later], [[False], [False], [False]])
+
+
+if __name__ == "__main__":
+    unittest.main()
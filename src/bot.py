@@ -1,22 +1,32 @@
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters import Command
+from aiogram.dispatcher.event.bases import SkipHandler
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from enum import Enum, auto
-from typing import List, Dict, Union, Optional, Set
+from typing import Callable, List, Dict, Union, Optional, Set, Tuple
 from datetime import datetime, timezone
 import aio_pika
+from aio_pika.pool import Pool
+import asyncio
+from collections import OrderedDict
+import functools
+import math
 import uuid
-import subprocess
 import tempfile
+import time
 import os
-import json
+import logging
+import orjson
 
 from config import Config
 from db import Database
 
+logger = logging.getLogger(__name__)
+
 
 class UserRole(Enum):
     """Роли пользователей в системе"""
@@ -73,53 +83,240 @@ class ModeratorMenuButton(Enum):
     RECENT_VIOLATIONS = "Последние нарушения"
 
 
-SYSADMIN_MENU_BUTTONS = [
-    [SysadminMenuButton.CHANNEL_ACTIVATION.value],
-    [SysadminMenuButton.ADMIN_ACTIVATION.value],
-    [SysadminMenuButton.ADMIN_LIST.value],
-    [SysadminMenuButton.CHANNEL_LIST.value]
-]
+# Типы групповых чатов, в которых бот мониторит сообщения
+_GROUP_TYPES = frozenset({'group', 'supergroup'})
+
+
+def _is_group_chat(message: types.Message) -> bool:
+    """Фильтр сообщений из групп: один поиск во frozenset без разбора magic-filter."""
+    return message.chat.type in _GROUP_TYPES
+
+
+def _is_private_chat(message: types.Message) -> bool:
+    """Фильтр сообщений не из групп."""
+    return message.chat.type not in _GROUP_TYPES
+
+
+def _orjson_dumps(obj) -> str:
+    """json_dumps для сессии aiogram: она ожидает строку, а не bytes."""
+    return orjson.dumps(obj).decode()
+
+
+# Очереди, в которые бот публикует информацию о сообщениях
+MULTIMEDIA_QUEUES = ("multimedia.images", "multimedia.audio", "multimedia.text")
+
+# Максимальное число каналов RabbitMQ для публикации
+CHANNEL_POOL_SIZE = 10
+
+# Время жизни закэшированной роли пользователя, секунды
+ROLE_CACHE_TTL = 60
+
+# Время жизни закэшированных COUNT(*) для индикатора страниц, секунды
+COUNT_CACHE_TTL = 60
+
+# Сколько отрисованных страниц списков держать в LRU-кэше
+MENU_CACHE_SIZE = 128
+
+# Время жизни и размер кэша деталей правил (число нарушений может отставать на TTL)
+RULE_CACHE_TTL = 30
+RULE_CACHE_SIZE = 4096
+
+# Подписи статусов и шаблоны текста кнопок списков
+_STATUS_ACTIVE = "активен"
+_STATUS_INACTIVE = "неактивен"
+_STATUS_BUTTON_TEXT = "%s (%s)"
+_USER_BUTTON_TEXT = "%s (@%s)"
+_VIOLATION_BUTTON_TEXT = "%s | %s | %s | %s"
+_RULE_BUTTON_TEXT = "%s: %s..."
+
+# Сколько символов сообщения нарушителя показывать на кнопке лога
+_MESSAGE_PREVIEW_LEN = 30
+
+
+# Подписи типов правил для сообщений и кнопок
+RULE_TYPE_LABELS = {
+    'BAN': '🚫 Бан',
+    'NOTIFY': '⚠️ Уведомление',
+    'OBSERVE': '👀 Слежение'
+}
+
+
+# Статические клавиатуры: собираются один раз при импорте, а не на каждый callback
+_CHAT_ACTION_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Добавить промпт", callback_data="add_prompt")],
+    [InlineKeyboardButton(text="Список правил", callback_data="list_prompts")]
+])
+
+_PROMPT_TYPE_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Бан", callback_data="prompt_type:BAN")],
+    [InlineKeyboardButton(text="Предупреждение модерам", callback_data="prompt_type:NOTIFY")],
+    [InlineKeyboardButton(text="Слежение", callback_data="prompt_type:OBSERVE")]
+])
 
-SYSADMIN_MENU = ReplyKeyboardMarkup(
-    keyboard=[[KeyboardButton(text=btn) for btn in row] for row in SYSADMIN_MENU_BUTTONS],
-    resize_keyboard=True
+_PROMPT_SILENT_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Тихий (без сообщения в чат)", callback_data="prompt_silent:true")],
+    [InlineKeyboardButton(text="Обычный (с сообщением в чат)", callback_data="prompt_silent:false")]
+])
+
+_VIOLATION_TYPE_BASE_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Бан", callback_data="violation_type:BAN")],
+    [InlineKeyboardButton(text="Предупреждение", callback_data="violation_type:NOTIFY")]
+])
+
+# Для администраторов дополнительно доступна кнопка "Наблюдение"
+_VIOLATION_TYPE_ADMIN_MARKUP = InlineKeyboardMarkup(
+    inline_keyboard=_VIOLATION_TYPE_BASE_MARKUP.inline_keyboard + [
+        [InlineKeyboardButton(text="Наблюдение", callback_data="violation_type:OBSERVE")]
+    ]
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _edit_rule_markup(rule_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура редактирования правила; одна и та же для всех экранов правила."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="◀️ Назад", callback_data=f"view_rule:{rule_id}"),
+        ],
+        [
+            InlineKeyboardButton(text="📝 Тип", callback_data=f"edit_rule_type:{rule_id}"),
+            InlineKeyboardButton(text="📝 Правило", callback_data=f"edit_rule_text:{rule_id}"),
+        ],
+        [
+            InlineKeyboardButton(text="📝 Объяснение", callback_data=f"edit_rule_explanation:{rule_id}"),
+        ]
+    ])
+
+
+@functools.lru_cache(maxsize=512)
+def _nav_buttons(prefix: str, page: int, total_pages: int, has_next: bool) -> Tuple[InlineKeyboardButton, ...]:
+    """Кнопки навигации страницы; одинаковые кнопки переиспользуются между отрисовками."""
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}:{page-1}"))
+    nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="noop"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}:{page+1}"))
+    return tuple(nav)
+
+
+def _nav_row(prefix: str, page: int, total_pages: int, has_next: bool) -> List[InlineKeyboardButton]:
+    """Строка навигации ⬅️ X/Y ➡️ для клавиатуры страницы."""
+    return list(_nav_buttons(prefix, page, total_pages, has_next))
+
+
+def _memoized_menu(key_fn):
+    """Кэширует клавиатуру страницы по содержимому строк и параметрам навигации."""
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(self, *args):
+            key = (build.__name__,) + key_fn(*args)
+            cache = self._menu_cache
+            markup = cache.get(key)
+            if markup is not None:
+                cache.move_to_end(key)
+                return markup
+            markup = cache[key] = build(self, *args)
+            if len(cache) > MENU_CACHE_SIZE:
+                cache.popitem(last=False)
+            return markup
+        return wrapper
+    return decorator
+
+
+def _cached_markup(rows) -> ReplyKeyboardMarkup:
+    """Собирает меню один раз без повторной pydantic-валидации заведомо корректных кнопок."""
+    return ReplyKeyboardMarkup.model_construct(
+        keyboard=[[KeyboardButton.model_construct(text=btn) for btn in row] for row in rows],
+        resize_keyboard=True
+    )
+
+
+# Меню - общие синглтоны, хендлеры не должны их изменять
+SYSADMIN_MENU_BUTTONS = (
+    (SysadminMenuButton.CHANNEL_ACTIVATION.value,),
+    (SysadminMenuButton.ADMIN_ACTIVATION.value,),
+    (SysadminMenuButton.ADMIN_LIST.value,),
+    (SysadminMenuButton.CHANNEL_LIST.value,)
 )
 
+SYSADMIN_MENU = _cached_markup(SYSADMIN_MENU_BUTTONS)
+
 # Меню для админов
-ADMIN_MENU_BUTTONS = [
-    [AdminMenuButton.MODERATOR_MANAGEMENT.value],
-    [AdminMenuButton.MODERATOR_LIST.value],
-    [AdminMenuButton.BAN_LOGS.value],
-    [AdminMenuButton.PROMPT_MANAGEMENT.value]
-]
-
-ADMIN_MENU = ReplyKeyboardMarkup(
-    keyboard=[[KeyboardButton(text=btn) for btn in row] for row in ADMIN_MENU_BUTTONS],
-    resize_keyboard=True
+ADMIN_MENU_BUTTONS = (
+    (AdminMenuButton.MODERATOR_MANAGEMENT.value,),
+    (AdminMenuButton.MODERATOR_LIST.value,),
+    (AdminMenuButton.BAN_LOGS.value,),
+    (AdminMenuButton.PROMPT_MANAGEMENT.value,)
 )
 
+ADMIN_MENU = _cached_markup(ADMIN_MENU_BUTTONS)
+
 # Меню для модераторов
-MODERATOR_MENU_BUTTONS = [
-    [ModeratorMenuButton.MY_CHATS.value],
-    [ModeratorMenuButton.BAN_LOGS.value],
-    [ModeratorMenuButton.NOTIFICATION_POLICIES.value],
-    [ModeratorMenuButton.RECENT_VIOLATIONS.value]
-]
-
-MODERATOR_MENU = ReplyKeyboardMarkup(
-    keyboard=[[KeyboardButton(text=btn) for btn in row] for row in MODERATOR_MENU_BUTTONS],
-    resize_keyboard=True
+MODERATOR_MENU_BUTTONS = (
+    (ModeratorMenuButton.MY_CHATS.value,),
+    (ModeratorMenuButton.BAN_LOGS.value,),
+    (ModeratorMenuButton.NOTIFICATION_POLICIES.value,),
+    (ModeratorMenuButton.RECENT_VIOLATIONS.value,)
 )
 
+MODERATOR_MENU = _cached_markup(MODERATOR_MENU_BUTTONS)
+
+# Текст кнопки меню -> имя метода TelegramBot, который её обрабатывает
+SYSADMIN_HANDLERS = {
+    SysadminMenuButton.CHANNEL_ACTIVATION.value: "_sysadmin_activate_channel",
+    SysadminMenuButton.ADMIN_ACTIVATION.value: "_sysadmin_manage_admins",
+    SysadminMenuButton.ADMIN_LIST.value: "_sysadmin_admin_list",
+    SysadminMenuButton.CHANNEL_LIST.value: "_sysadmin_channel_list",
+}
+
+ADMIN_HANDLERS = {
+    AdminMenuButton.MODERATOR_MANAGEMENT.value: "handle_moderator_menu",
+    AdminMenuButton.MODERATOR_LIST.value: "handle_show_all_moderators",
+    AdminMenuButton.BAN_LOGS.value: "handle_logs_entry",
+    AdminMenuButton.PROMPT_MANAGEMENT.value: "handle_prompt_management",
+}
+
+MODERATOR_HANDLERS = {
+    ModeratorMenuButton.MY_CHATS.value: "_moderator_my_chats",
+    ModeratorMenuButton.BAN_LOGS.value: "handle_logs_entry",
+    ModeratorMenuButton.NOTIFICATION_POLICIES.value: "handle_show_notification_policies",
+    ModeratorMenuButton.RECENT_VIOLATIONS.value: "handle_recent_violations_entry",
+}
+
 
 class TelegramBot:
     def __init__(self, config: Config, db: Database):
         self.config = config
+        # Размер страницы не меняется во время работы, читаем его из конфига один раз
+        self._page_size = config.ui.page_size
+        self._build_channel_menu = functools.partial(self._build_paged_menu, page_prefix="page")
+        self._build_admin_menu = functools.partial(self._build_paged_menu, page_prefix="admin_page")
         self.db = db
-        self.bot = Bot(token=config.telegram.bot_token)
+        # Запросы к Bot API (в т.ч. клавиатуры) сериализуем через orjson
+        session = AiohttpSession(json_loads=orjson.loads, json_dumps=_orjson_dumps)
+        self.bot = Bot(token=config.telegram.bot_token, session=session)
         self.dp = Dispatcher(storage=MemoryStorage())
         self.rabbitmq_connection = None
-        self.rabbitmq_channel = None
+        self.channel_pool = None
+        self._queues_ready = False
+        # Однопоточные ffmpeg, не больше половины ядер одновременно
+        self.ffmpeg_semaphore = asyncio.Semaphore(max(1, (os.cpu_count() or 1) // 2))
+        # Кэш ролей: user_id -> (роль, момент истечения)
+        self._role_cache: Dict[int, Tuple[UserRole, float]] = {}
+        # Кэш количеств для пагинации: ключ -> (значение, момент истечения)
+        self._count_cache: Dict[str, Tuple[int, float]] = {}
+        # Отрисованные страницы списков; ключ включает данные строк, поэтому изменения дают новый ключ
+        self._menu_cache: "OrderedDict[tuple, InlineKeyboardMarkup]" = OrderedDict()
+        # Кэш деталей правил: rule_id -> (правило, момент истечения)
+        self._rule_cache: "OrderedDict[int, Tuple[Dict, float]]" = OrderedDict()
+        self._count_queries: Dict[str, Callable] = {
+            "users": self.db.get_users_count,
+            "moderators": self.db.get_moderators_count,
+            "chats": self.db.get_chats_count,
+            "active_chats": functools.partial(self.db.get_chats_count, activated_only=True),
+            "bot_chats": self.db.get_bot_chats_count,
+        }
         
         # Регистрируем хендлеры
         self._register_handlers()
@@ -133,108 +330,110 @@ class TelegramBot:
             password=self.config.queue.password,
             virtualhost=self.config.queue.vhost
         )
-        self.rabbitmq_channel = await self.rabbitmq_connection.channel()
-        await self.rabbitmq_channel.declare_queue("multimedia.images", durable=True)
-        await self.rabbitmq_channel.declare_queue("multimedia.audio", durable=True)
-        await self.rabbitmq_channel.declare_queue("multimedia.text", durable=True)
+        # Пул каналов, чтобы параллельные хендлеры не ждали друг друга на одном канале
+        self.channel_pool = Pool(self._make_channel, max_size=CHANNEL_POOL_SIZE)
+        await self._ensure_queues()
+
+    async def _ensure_queues(self):
+        """Проверяет очереди один раз за время жизни бота: пассивно, полное объявление - только если очереди нет."""
+        if self._queues_ready:
+            return
+        # Отдельный канал: неудачная пассивная проверка закрывает канал, в пул он попасть не должен
+        channel = await self.rabbitmq_connection.channel()
+        try:
+            for name in MULTIMEDIA_QUEUES:
+                try:
+                    await channel.declare_queue(name, passive=True)
+                except aio_pika.exceptions.ChannelClosed:
+                    channel = await self.rabbitmq_connection.channel()
+                    await channel.declare_queue(name, durable=True)
+        finally:
+            await channel.close()
+        self._queues_ready = True
+
+    async def _make_channel(self) -> aio_pika.abc.AbstractChannel:
+        """Creates a new channel for the channel pool."""
+        # multimedia.* - поток событий, ждать подтверждения брокера на каждую публикацию не нужно
+        return await self.rabbitmq_connection.channel(publisher_confirms=False)
 
     async def close_rabbitmq(self):
         """Closes RabbitMQ connection."""
-        if self.rabbitmq_channel:
-            await self.rabbitmq_channel.close()
+        if self.channel_pool:
+            await self.channel_pool.close()
         if self.rabbitmq_connection:
             await self.rabbitmq_connection.close()
 
-    async def extract_video_frame(self, video_path: str) -> bytes:
-        """Извлекает центральный кадр из видео с помощью ffmpeg."""
-        print(f"[DEBUG] Starting frame extraction with ffmpeg from {video_path}")
-        try:
-            # Получаем длительность видео
-            duration_cmd = [
-                'ffprobe', 
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                video_path
-            ]
-            print(f"[DEBUG] Running ffprobe command: {' '.join(duration_cmd)}")
-            duration = float(subprocess.check_output(duration_cmd).decode().strip())
-            print(f"[DEBUG] Video duration: {duration} seconds")
-            
-            # Вычисляем время для центрального кадра
-            middle_time = duration / 2
-            print(f"[DEBUG] Extracting frame at {middle_time} seconds")
-            
-            # Извлекаем кадр
-            frame_path = f"{video_path}_frame.jpg"
-            extract_cmd = [
-                'ffmpeg',
-                '-ss', str(middle_time),
-                '-i', video_path,
-                '-vframes', '1',
-                '-q:v', '2',
-                '-y',
-                frame_path
-            ]
-            print(f"[DEBUG] Running ffmpeg command: {' '.join(extract_cmd)}")
-            subprocess.run(extract_cmd, check=True, capture_output=True)
-            
-            # Читаем полученный кадр
-            print(f"[DEBUG] Reading extracted frame from {frame_path}")
-            with open(frame_path, 'rb') as f:
-                frame_data = f.read()
-            print(f"[DEBUG] Frame extracted successfully, size: {len(frame_data)} bytes")
-            
-            # Удаляем временный файл
-            os.unlink(frame_path)
-            print(f"[DEBUG] Temporary frame file deleted")
-            
-            return frame_data
-        except subprocess.CalledProcessError as e:
-            print(f"[DEBUG] Error during frame extraction: {e.stderr.decode()}")
-            raise Exception(f"Failed to extract frame: {e.stderr.decode()}")
-        except Exception as e:
-            print(f"[DEBUG] Unexpected error during frame extraction: {str(e)}")
-            raise
-
-    async def extract_video_audio(self, video_file: str) -> bytes:
-        """Extracts audio from video using ffmpeg."""
-        print(f"[DEBUG] Starting audio extraction with ffmpeg from {video_file}")
+    async def extract_video_media(self, video_path: str, duration: Optional[float] = None) -> tuple:
+        """Извлекает центральный кадр и аудиодорожку из видео одним вызовом ffmpeg."""
+        # Длительность берём из метаданных Telegram, поэтому ffprobe не нужен
+        middle_time = duration / 2 if duration else 0
+        # Кадр уходит в stdout, аудио - в отдельный пайп, временных файлов нет.
+        # Файл открыт дважды: для кадра - с быстрым -ss перед -i, чтобы не
+        # декодировать видео до середины, для аудио - целиком с начала
+        audio_read_fd, audio_write_fd = os.pipe()
+        extract_cmd = [
+            'ffmpeg',
+            '-v', 'error',
+            '-threads', '1',
+            '-ss', str(middle_time),
+            '-i', video_path,
+            '-threads', '1',
+            '-i', video_path,
+            '-map', '0:v:0',
+            '-vframes', '1',
+            '-q:v', '2',
+            '-threads', '1',
+            '-f', 'image2pipe',
+            '-vcodec', 'mjpeg',
+            'pipe:1',
+            '-map', '1:a:0',
+            '-acodec', 'libmp3lame',
+            '-q:a', '2',
+            '-threads', '1',
+            '-f', 'mp3',
+            f'pipe:{audio_write_fd}'
+        ]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Running ffmpeg command: %s", ' '.join(extract_cmd))
         try:
-            # Extract audio to temporary file
-            audio_path = f"{video_file}_audio.mp3"
-            print(f"[DEBUG] Will save audio to {audio_path}")
-            
-            extract_cmd = [
-                'ffmpeg',
-                '-i', video_file,
-                '-vn',  # No video
-                '-acodec', 'libmp3lame',
-                '-q:a', '2',
-                '-y',
-                audio_path
-            ]
-            print(f"[DEBUG] Running ffmpeg command: {' '.join(extract_cmd)}")
-            subprocess.run(extract_cmd, check=True, capture_output=True)
-            print(f"[DEBUG] Audio extraction completed")
-            
-            # Read the audio file
-            print(f"[DEBUG] Reading extracted audio from {audio_path}")
-            with open(audio_path, 'rb') as f:
-                audio_data = f.read()
-            print(f"[DEBUG] Audio read successfully, size: {len(audio_data)} bytes")
-            
-            # Clean up
-            os.unlink(audio_path)
-            print(f"[DEBUG] Temporary audio file deleted")
-            
-            return audio_data
-        except subprocess.CalledProcessError as e:
-            print(f"[DEBUG] Error during audio extraction: {e.stderr.decode()}")
-            raise Exception(f"Failed to extract audio: {e.stderr.decode()}")
-        except Exception as e:
-            print(f"[DEBUG] Unexpected error during audio extraction: {str(e)}")
+            proc = await asyncio.create_subprocess_exec(
+                *extract_cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=(audio_write_fd,)
+            )
+        except Exception:
+            os.close(audio_read_fd)
+            os.close(audio_write_fd)
             raise
+        # Пишущий конец нужен только ffmpeg, иначе чтение аудио не увидит EOF
+        os.close(audio_write_fd)
+
+        loop = asyncio.get_running_loop()
+        audio_reader = asyncio.StreamReader()
+        with open(audio_read_fd, 'rb', buffering=0) as audio_pipe:
+            transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(audio_reader), audio_pipe
+            )
+            try:
+                (frame_data, stderr), audio_data = await asyncio.gather(
+                    proc.communicate(), audio_reader.read()
+                )
+            finally:
+                transport.close()
+
+        if proc.returncode != 0:
+            raise Exception(f"Failed to extract media: {stderr.decode()}")
+        return frame_data, audio_data
+
+    async def process_video(self, video_path: str, duration: Optional[float] = None) -> tuple:
+        """Извлекает кадр и аудио из видео и параллельно сохраняет их в БД."""
+        async with self.ffmpeg_semaphore:
+            frame_data, audio_data = await self.extract_video_media(video_path, duration)
+        return await asyncio.gather(
+            self.db.store_image(frame_data),
+            self.db.store_audio(audio_data)
+        )
     
     async def get_user_role(self, user_id: int) -> UserRole:
         """
@@ -249,54 +448,119 @@ class TelegramBot:
         # Проверяем, является ли пользователь системным администратором
         if user_id in self.config.admin.sysadmin_ids:
             return UserRole.SYSADMIN
-            
-        # Проверяем, является ли пользователь администратором в каких-либо чатах
-        admin_chats = await self.db.get_moderator_chats_for_user(user_id)
-        if admin_chats:
-            return UserRole.ADMIN
-            
-        # Проверяем, является ли пользователь модератором в каких-либо чатах
-        moderator_chats = await self.db.get_user_moderator_chats(user_id)
-        if moderator_chats:
-            return UserRole.MODERATOR
-            
-        # Если ни одна из ролей не подходит, считаем пользователя анонимным
-        return UserRole.ANONYMOUS
+
+        now = time.monotonic()
+        cached = self._role_cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        # Админство и модераторство проверяем одним запросом
+        is_admin, is_moderator = await self.db.get_role_flags(user_id)
+        if is_admin:
+            role = UserRole.ADMIN
+        elif is_moderator:
+            role = UserRole.MODERATOR
+        else:
+            # Если ни одна из ролей не подходит, считаем пользователя анонимным
+            role = UserRole.ANONYMOUS
+        self._role_cache[user_id] = (role, now + ROLE_CACHE_TTL)
+        return role
+
+    def invalidate_role(self, user_id: Optional[int] = None) -> None:
+        """Сбрасывает закэшированную роль пользователя или весь кэш ролей."""
+        if user_id is None:
+            self._role_cache.clear()
+        else:
+            self._role_cache.pop(user_id, None)
+
+    async def _cached_count(self, key: str) -> int:
+        """Возвращает количество записей для индикатора страниц, кэшируя COUNT(*) на COUNT_CACHE_TTL."""
+        now = time.monotonic()
+        cached = self._count_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        count = await self._count_queries[key]()
+        self._count_cache[key] = (count, now + COUNT_CACHE_TTL)
+        return count
+
+    def invalidate_counts(self) -> None:
+        """Сбрасывает закэшированные количества после изменения чатов, админов или модераторов."""
+        self._count_cache.clear()
+
+    async def _cached_rule(self, rule_id: int) -> Optional[Dict]:
+        """Возвращает детали правила, кэшируя их на RULE_CACHE_TTL."""
+        now = time.monotonic()
+        cached = self._rule_cache.get(rule_id)
+        if cached and cached[1] > now:
+            self._rule_cache.move_to_end(rule_id)
+            return cached[0]
+        rule = await self.db.get_rule_details(rule_id)
+        if rule is not None:
+            self._rule_cache[rule_id] = (rule, now + RULE_CACHE_TTL)
+            self._rule_cache.move_to_end(rule_id)
+            if len(self._rule_cache) > RULE_CACHE_SIZE:
+                self._rule_cache.popitem(last=False)
+        return rule
+
+    def invalidate_rule(self, rule_id: int) -> None:
+        """Сбрасывает закэшированные детали правила после его изменения."""
+        self._rule_cache.pop(rule_id, None)
     
     def _register_handlers(self):
         """Регистрация всех хендлеров в правильном порядке"""
 
         # Add message handler for monitoring messages - moved to the top to ensure it's registered first
-        self.dp.message.register(self.handle_message_monitoring, F.chat.type.in_({'group', 'supergroup'}))
+        self.dp.message.register(self.handle_message_monitoring, _is_group_chat)
 
         # 1. F.contact в конкретных состояниях FSM
         self.dp.message.register(self.handle_contact, BotStates.waiting_for_contact, F.contact)
 
-        # 2. CallbackQuery-хендлеры с состояниями
-        self.dp.callback_query.register(self.handle_channel_page, F.data.startswith("page:"), BotStates.waiting_for_channel_selection)
-        self.dp.callback_query.register(self.handle_channel_select, F.data.startswith("select_channel:"), BotStates.waiting_for_channel_selection)
-        self.dp.callback_query.register(self.handle_deactivate_channel_page, F.data.startswith("deact_page:"), BotStates.waiting_for_deactivate_channel_selection)
-        self.dp.callback_query.register(self.handle_deactivate_channel_select, F.data.startswith("deact_channel:"), BotStates.waiting_for_deactivate_channel_selection)
-        self.dp.callback_query.register(self.handle_admins_page, F.data.startswith("admins_page:"), BotStates.show_all_admins)
-        self.dp.callback_query.register(self.handle_channels_page, F.data.startswith("channels_page:"), BotStates.show_all_channels)
-        self.dp.callback_query.register(self.handle_moderator_channel_page, F.data.startswith("mod_page:"), BotStates.waiting_for_moderator_channel_selection)
-        self.dp.callback_query.register(self.handle_moderator_channel_select, F.data.startswith("toggle_moderator:"), BotStates.waiting_for_moderator_channel_selection)
-        self.dp.callback_query.register(self.handle_moderators_page, F.data.startswith("moderators_page:"), BotStates.show_all_moderators)
-        self.dp.callback_query.register(self.handle_log_channel_select, F.data.startswith("log_channel:"), BotStates.waiting_for_log_channel_selection)
-        self.dp.callback_query.register(self.handle_log_violation_select, F.data.startswith("log_violation:"), BotStates.waiting_for_violation_selection)
-        self.dp.callback_query.register(self.handle_change_decision, F.data.startswith("change_decision:"), BotStates.waiting_for_decision_action)
-        self.dp.callback_query.register(self.handle_toggle_notification_policy, F.data.startswith("toggle_policy:"), BotStates.waiting_for_notification_policy)
-        self.dp.callback_query.register(self.handle_chat_selection_for_prompt, F.data.startswith("select_chat_for_prompt:"))
-        self.dp.callback_query.register(self.handle_prompt_type, F.data.startswith("prompt_type:"), BotStates.waiting_for_prompt_type)
-        self.dp.callback_query.register(self.handle_prompt_reason, F.data.startswith("prompt_silent:"), BotStates.waiting_for_prompt_reason)
+        # 2. CallbackQuery: маршрут выбирается по префиксу до ":". Таблиц две, чтобы
+        # сохранить исходный порядок относительно колбэков в состоянии ввода объяснения
+        self._cb_routes: Dict[str, Tuple[Callable, Optional[str]]] = {
+            "page": (self.handle_channel_page, BotStates.waiting_for_channel_selection.state),
+            "select_channel": (self.handle_channel_select, BotStates.waiting_for_channel_selection.state),
+            "admin_page": (self.handle_admin_page, BotStates.waiting_for_contact.state),
+            "deact_page": (self.handle_deactivate_channel_page, BotStates.waiting_for_deactivate_channel_selection.state),
+            "deact_channel": (self.handle_deactivate_channel_select, BotStates.waiting_for_deactivate_channel_selection.state),
+            "admins_page": (self.handle_admins_page, BotStates.show_all_admins.state),
+            "channels_page": (self.handle_channels_page, BotStates.show_all_channels.state),
+            "mod_page": (self.handle_moderator_channel_page, BotStates.waiting_for_moderator_channel_selection.state),
+            "toggle_moderator": (self.handle_moderator_channel_select, BotStates.waiting_for_moderator_channel_selection.state),
+            "moderators_page": (self.handle_moderators_page, BotStates.show_all_moderators.state),
+            "log_channel": (self.handle_log_channel_select, BotStates.waiting_for_log_channel_selection.state),
+            "log_violation": (self.handle_log_violation_select, BotStates.waiting_for_violation_selection.state),
+            "change_decision": (self.handle_change_decision, BotStates.waiting_for_decision_action.state),
+            "toggle_policy": (self.handle_toggle_notification_policy, BotStates.waiting_for_notification_policy.state),
+            "select_chat_for_prompt": (self.handle_chat_selection_for_prompt, None),
+            "prompt_type": (self.handle_prompt_type, BotStates.waiting_for_prompt_type.state),
+            "prompt_silent": (self.handle_prompt_reason, BotStates.waiting_for_prompt_reason.state),
+        }
+        # Проверяются после колбэков в состоянии ввода объяснения: в нём эти кнопки уходят туда
+        self._cb_routes_late: Dict[str, Tuple[Callable, Optional[str]]] = {
+            "activate_channel_cmd": (self.handle_activate_channel_cmd, None),
+            "noop": (self.handle_noop, None),
+            "toggle_channel": (self.handle_toggle_channel, None),
+            "toggle_admin": (self.handle_toggle_admin, None),
+            "add_prompt": (self.handle_add_prompt, None),
+            # Работа с правилами
+            "list_prompts": (self.handle_list_prompts, None),
+            "rules_page": (self.handle_rules_page, None),
+            "view_rule": (self.handle_view_rule, None),
+            "delete_rule": (self.handle_delete_rule, None),
+            "edit_rule": (self.handle_edit_rule, None),
+            "edit_rule_type": (self.handle_edit_rule_type, None),
+            "edit_rule_text": (self.handle_edit_rule_text, None),
+            "edit_rule_explanation": (self.handle_edit_rule_explanation, None),
+            "rule_type": (self.handle_rule_type_edit, None),
+            # Последние нарушения
+            "violation_type": (self.handle_violation_type_select, BotStates.waiting_for_violation_type.state),
+            "violation_action": (self.handle_violation_action, None),
+        }
+        self.dp.callback_query.register(functools.partial(self._dispatch_callback, self._cb_routes))
+        # Колбэки в состоянии ввода объяснения, не попавшие в первую таблицу
         self.dp.callback_query.register(self.handle_prompt_explanation, BotStates.waiting_for_prompt_explanation)
-
-        # 3. CallbackQuery-хендлеры без состояний
-        self.dp.callback_query.register(self.handle_activate_channel_cmd, F.data == "activate_channel_cmd")
-        self.dp.callback_query.register(self.handle_noop, F.data == "noop")
-        self.dp.callback_query.register(self.handle_toggle_channel, F.data.startswith("toggle_channel:"))
-        self.dp.callback_query.register(self.handle_toggle_admin, F.data.startswith("toggle_admin:"))
-        self.dp.callback_query.register(self.handle_add_prompt, F.data == "add_prompt")
+        self.dp.callback_query.register(functools.partial(self._dispatch_callback, self._cb_routes_late))
 
         # 4. Message-хендлеры с состояниями
         self.dp.message.register(self.handle_prompt_text, BotStates.waiting_for_prompt_text)
@@ -309,44 +573,28 @@ class TelegramBot:
         self.dp.message.register(self.cmd_start, Command(commands=["start"]))
 
         # 6. Основное меню (Любой текст, если не было мэтча)
-        self.dp.message.register(self.handle_main_menu, F.text & ~F.chat.type.in_({'group', 'supergroup'}))
+        self.dp.message.register(self.handle_main_menu, _is_private_chat, F.text)
 
         # 7. Обработчики событий для обновления БД
         self.dp.my_chat_member.register(self.handle_my_chat_member)
         self.dp.chat_member.register(self.handle_chat_member)
 
-        # 8. Debug-хендлеры (в самом конце)
-        self.dp.message.register(self.debug_log_message)
-        self.dp.message.register(self.debug_contact, F.contact)
-        self.dp.message.register(self.debug_any)
-
-        # Новые хендлеры для работы с правилами
-        self.dp.callback_query.register(self.handle_list_prompts, F.data == "list_prompts")
-        self.dp.callback_query.register(self.handle_rules_page, F.data.startswith("rules_page:"))
-        self.dp.callback_query.register(self.handle_view_rule, F.data.startswith("view_rule:"))
-        self.dp.callback_query.register(self.handle_delete_rule, F.data.startswith("delete_rule:"))
-        self.dp.callback_query.register(self.handle_edit_rule, F.data.startswith("edit_rule:"))
-        
-        # Обработчики редактирования правил
-        self.dp.callback_query.register(self.handle_edit_rule_type, F.data.startswith("edit_rule_type:"))
-        self.dp.callback_query.register(self.handle_edit_rule_text, F.data.startswith("edit_rule_text:"))
-        self.dp.callback_query.register(self.handle_edit_rule_explanation, F.data.startswith("edit_rule_explanation:"))
-        self.dp.callback_query.register(self.handle_rule_type_edit, F.data.startswith("rule_type:"))
-        
-        # Обработчики для последних нарушений
-        self.dp.callback_query.register(
-            self.handle_violation_type_select,
-            F.data.startswith("violation_type:"),
-            BotStates.waiting_for_violation_type
-        )
-        
-        self.dp.callback_query.register(
-            self.handle_violation_action,
-            F.data.startswith("violation_action:")
-        )
-
+        # 8. Debug-хендлеры (в самом конце), только при включённом DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            self.dp.message.register(self.debug_contact, F.contact)
+            self.dp.message.register(self.debug_any)
+
+    async def _dispatch_callback(self, routes, query: types.CallbackQuery, state: FSMContext):
+        """Находит хендлер колбэка по префиксу данных одним поиском в словаре routes."""
+        prefix, _, _ = (query.data or "").partition(":")
+        route = routes.get(prefix)
+        if route is None:
+            raise SkipHandler()
+        handler, required_state = route
+        if required_state is not None and await state.get_state() != required_state:
+            raise SkipHandler()
+        await handler(query, state)
 
-    
     async def cmd_start(self, message: types.Message):
         user_id = message.from_user.id
         user_role = await self.get_user_role(user_id)
@@ -383,65 +631,61 @@ class TelegramBot:
 
     async def _handle_sysadmin_menu(self, message: types.Message, state: FSMContext):
         """Обработчик меню системного администратора."""
-        match message.text:
-            case SysadminMenuButton.CHANNEL_ACTIVATION.value:
-                await message.answer(
-                    "Пожалуйста, перейдите в профиль администратора канала, который вы хотите активировать, "
-                    "и выберите 'Поделиться контактом'. Затем перешлите контакт сюда.",
-                    reply_markup=SYSADMIN_MENU
-                )
-                await state.set_state(BotStates.waiting_for_contact)
-                await state.update_data(action_type='activate_channel')
-            case SysadminMenuButton.ADMIN_ACTIVATION.value:
-                await message.answer(
-                    "Пожалуйста, перейдите в профиль администратора, которого хотите активировать или деактивировать, "
-                    "и выберите 'Поделиться контактом'. Затем перешлите контакт сюда.",
-                    reply_markup=SYSADMIN_MENU
-                )
-                await state.set_state(BotStates.waiting_for_contact)
-                await state.update_data(action_type='deactivate_admin')
-            case SysadminMenuButton.ADMIN_LIST.value:
-                await state.set_state(BotStates.show_all_admins)
-                await self._send_admins_page(message, 0, state)
-            case SysadminMenuButton.CHANNEL_LIST.value:
-                await state.set_state(BotStates.show_all_channels)
-                await self._send_channels_page(message, 0, state)
-            case _:
-                await message.answer("Неизвестная команда", reply_markup=SYSADMIN_MENU)
+        handler_name = SYSADMIN_HANDLERS.get(message.text)
+        if handler_name is None:
+            await message.answer("Неизвестная команда", reply_markup=SYSADMIN_MENU)
+            return
+        await getattr(self, handler_name)(message, state)
+
+    async def _sysadmin_activate_channel(self, message: types.Message, state: FSMContext):
+        await message.answer(
+            "Пожалуйста, перейдите в профиль администратора канала, который вы хотите активировать, "
+            "и выберите 'Поделиться контактом'. Затем перешлите контакт сюда.",
+            reply_markup=SYSADMIN_MENU
+        )
+        await state.set_state(BotStates.waiting_for_contact)
+        await state.update_data(action_type='activate_channel')
+
+    async def _sysadmin_manage_admins(self, message: types.Message, state: FSMContext):
+        await message.answer(
+            "Пожалуйста, перейдите в профиль администратора, которого хотите активировать или деактивировать, "
+            "и выберите 'Поделиться контактом'. Затем перешлите контакт сюда.",
+            reply_markup=SYSADMIN_MENU
+        )
+        await state.set_state(BotStates.waiting_for_contact)
+        await state.update_data(action_type='deactivate_admin')
+
+    async def _sysadmin_admin_list(self, message: types.Message, state: FSMContext):
+        await state.set_state(BotStates.show_all_admins)
+        await self._send_admins_page(message, 0, state)
+
+    async def _sysadmin_channel_list(self, message: types.Message, state: FSMContext):
+        await state.set_state(BotStates.show_all_channels)
+        await self._send_channels_page(message, 0, state)
 
     async def _handle_admin_menu(self, message: types.Message, state: FSMContext):
         """Обработчик меню администратора."""
-        match message.text:
-            case AdminMenuButton.MODERATOR_MANAGEMENT.value:
-                await self.handle_moderator_menu(message, state)
-            case AdminMenuButton.MODERATOR_LIST.value:
-                await self.handle_show_all_moderators(message, state)
-            case AdminMenuButton.BAN_LOGS.value:
-                await self.handle_logs_entry(message, state)
-            case AdminMenuButton.PROMPT_MANAGEMENT.value:
-                await self.handle_prompt_management(message, state)
-            case _:
-                await message.answer("Неизвестная команда.", reply_markup=ADMIN_MENU)
+        handler_name = ADMIN_HANDLERS.get(message.text)
+        if handler_name is None:
+            await message.answer("Неизвестная команда.", reply_markup=ADMIN_MENU)
+            return
+        await getattr(self, handler_name)(message, state)
 
     async def _handle_moderator_menu(self, message: types.Message, state: FSMContext):
         """Обработчик меню модератора."""
-        user_id = message.from_user.id
-        match message.text:
-            case ModeratorMenuButton.MY_CHATS.value:
-                moderator_chats = await self.db.get_user_moderator_chats(user_id)
-                await message.answer(
-                    "Вы являетесь модератором в следующих чатах:\n" +
-                    "\n".join([f"• {chat['title']}" for chat in moderator_chats]),
-                    reply_markup=MODERATOR_MENU
-                )
-            case ModeratorMenuButton.BAN_LOGS.value:
-                await self.handle_logs_entry(message, state)
-            case ModeratorMenuButton.NOTIFICATION_POLICIES.value:
-                await self.handle_show_notification_policies(message, state)
-            case ModeratorMenuButton.RECENT_VIOLATIONS.value:
-                await self.handle_recent_violations_entry(message, state)
-            case _:
-                await message.answer("Неизвестная команда.", reply_markup=MODERATOR_MENU)
+        handler_name = MODERATOR_HANDLERS.get(message.text)
+        if handler_name is None:
+            await message.answer("Неизвестная команда.", reply_markup=MODERATOR_MENU)
+            return
+        await getattr(self, handler_name)(message, state)
+
+    async def _moderator_my_chats(self, message: types.Message, state: FSMContext):
+        moderator_chats = await self.db.get_user_moderator_chats(message.from_user.id)
+        await message.answer(
+            "Вы являетесь модератором в следующих чатах:\n" +
+            "\n".join([f"• {chat['title']}" for chat in moderator_chats]),
+            reply_markup=MODERATOR_MENU
+        )
 
     async def handle_contact(self, message: types.Message, state: FSMContext):
         """
@@ -479,11 +723,7 @@ class TelegramBot:
     
     async def handle_contact_for_channel(self, message: types.Message, state: FSMContext):
         contact = message.contact
-        print(f"[LOG] Contact object: {contact}")
-        print(f"[LOG] Contact attributes: {dir(contact)}")
-        print(f"[LOG] Contact first_name: {contact.first_name}")
-        print(f"[LOG] Contact last_name: {contact.last_name}")
-        print(f"[LOG] Contact user_id: {contact.user_id}")
+        logger.debug("Contact object: %s", contact)
         
         admin_user_id = contact.user_id
         # Получаем данные пользователя из контакта
@@ -492,22 +732,22 @@ class TelegramBot:
         full_name = contact.first_name
         if contact.last_name:
             full_name += f" {contact.last_name}"
-        print(f"[LOG] Получен контакт: user_id={admin_user_id}, username={username}, full_name={full_name}")
+        logger.debug("Получен контакт: user_id=%s, username=%s, full_name=%s", admin_user_id, username, full_name)
 
         # Проверяем, есть ли пользователь уже в users
         user_exists = await self.db.user_exists(admin_user_id)
         if not user_exists:
             await self.db.add_or_update_user(admin_user_id, username, full_name)
-            print(f"[LOG] Данные пользователя сохранены в БД")
+            logger.debug("Данные пользователя сохранены в БД")
         else:
-            print(f"[LOG] Пользователь уже есть в users, не обновляем запись")
+            logger.debug("Пользователь уже есть в users, не обновляем запись")
 
         await state.update_data(selected_admin_user_id=admin_user_id)
-        print(f"[LOG] FSM: update_data selected_admin_user_id={admin_user_id}")
+        logger.debug("FSM: update_data selected_admin_user_id=%s", admin_user_id)
         my_chats = await self.db.get_admin_chats_for_user(admin_user_id)
-        print(f"[LOG] Каналы пользователя {admin_user_id}: {my_chats}")
+        logger.debug("Каналы пользователя %s: %s", admin_user_id, my_chats)
         if not my_chats:
-            print("[LOG] Нет каналов для пользователя, показываем кнопку добавления.")
+            logger.debug("Нет каналов для пользователя, показываем кнопку добавления.")
             markup = InlineKeyboardMarkup(
                 inline_keyboard=[
                     [InlineKeyboardButton(text="Добавить канал", callback_data="activate_channel_cmd")]
@@ -519,47 +759,45 @@ class TelegramBot:
                 reply_markup=markup
             )
             await state.clear()
-            print(f"[LOG] FSM: state cleared")
+            logger.debug("FSM: state cleared")
             return
 
-        await state.update_data(channels=my_chats, page=0)
-        print(f"[LOG] FSM: update_data channels/page")
         await self._send_channel_page(message, my_chats, 0, state)
         await state.set_state(BotStates.waiting_for_channel_selection)
-        print(f"[LOG] FSM: set_state -> waiting_for_channel_selection")
+        logger.debug("FSM: set_state -> waiting_for_channel_selection")
     
-    def _build_channel_menu(self, channels, page, page_size):
-        start = page * page_size
-        end = start + page_size
-        page_channels = channels[start:end]
-        keyboard = []
-        for ch in page_channels:
-            status = "активен" if ch.get('activated', True) else "неактивен"
-            btn_text = f"{ch['title']} ({status})"
-            keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"toggle_channel:{ch['id']}")])
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(len(channels)-1)//page_size+1}", callback_data="noop"))
-        if end < len(channels):
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+    def _total_pages(self, total: int) -> int:
+        """Число страниц для индикатора X/Y; пустой список - одна страница."""
+        return max(1, math.ceil(total / self._page_size))
+
+    @staticmethod
+    def _build_paged_menu(buttons, page, total_pages, has_next, page_prefix):
+        """Собирает меню из кнопок текущей страницы и строку навигации."""
+        keyboard = [[btn] for btn in buttons]
+        keyboard.append(_nav_row(page_prefix, page, total_pages, has_next))
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
-    
+
     async def _send_channel_page(self, message_or_query, channels, page, state):
-        page_size = self.config.ui.page_size
-        markup = self._build_channel_menu(channels, page, page_size)
+        page_size = self._page_size
+        start = page * page_size
+        # Кнопки строим только для видимой страницы
+        channel_buttons = [
+            InlineKeyboardButton(
+                text=_STATUS_BUTTON_TEXT % (ch['title'], _STATUS_ACTIVE if ch.get('activated', True) else _STATUS_INACTIVE),
+                callback_data=f"toggle_channel:{ch['id']}"
+            )
+            for ch in channels[start:start + page_size]
+        ]
+        markup = self._build_channel_menu(
+            channel_buttons, page, self._total_pages(len(channels)), start + page_size < len(channels)
+        )
         text = "Выберите канал для активации:" if channels else "Нет доступных каналов."
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(page=page)
+        await self._send_page(message_or_query, text, markup, state, "page", page)
     
     async def handle_channel_page(self, query: types.CallbackQuery, state: FSMContext):
         data = await state.get_data()
-        channels = data.get("channels", [])
+        # В FSM лежит только id админа, список каналов берём из БД
+        channels = await self.db.get_admin_chats_for_user(data.get("selected_admin_user_id"))
         page = int(query.data.split(":")[1])
         await self._send_channel_page(query, channels, page, state)
         await query.answer()
@@ -567,147 +805,100 @@ class TelegramBot:
     async def handle_channel_select(self, query: types.CallbackQuery, state: FSMContext):
         channel_id = int(query.data.split(":")[1])
         data = await state.get_data()
-        channels = data.get("channels", [])
-        channel = next((c for c in channels if c["id"] == channel_id), None)
         selected_admin_user_id = data.get("selected_admin_user_id")
-        print(f"[LOG] Выбран канал: {channel_id}, выбранный админ: {selected_admin_user_id}")
+        # Ищем только выбранный канал по ключу, а не перебором всего списка
+        channel = await self.db.get_admin_chat(selected_admin_user_id, channel_id)
+        logger.debug("Выбран канал: %s, выбранный админ: %s", channel_id, selected_admin_user_id)
         if channel:
-            # Проверяем, активирован ли уже канал
-            async with self.db.pool.acquire() as conn:
-                row = await conn.fetchrow('SELECT activated FROM chats WHERE id = $1', channel_id)
-                if row and row['activated']:
-                    await query.message.edit_text(f"Канал {channel['title']} (ID: {channel['id']}) уже активирован!")
-                    await state.clear()
-                    return
-            print(f"[LOG] Активируем канал {channel_id}")
-            await self.db.add_chat(
-                channel_id,
-                channel["title"],
-                activated=True,
-                is_bot_in=True
-            )
+            logger.debug("Активируем канал %s", channel_id)
+            # Проверка "уже активирован" встроена в сам upsert
+            if not await self.db.activate_chat_if_inactive(channel_id, channel["title"]):
+                await query.message.edit_text(f"Канал {channel['title']} (ID: {channel['id']}) уже активирован!")
+                await state.clear()
+                return
+            self.invalidate_role()
+            self.invalidate_counts()
             await query.message.edit_text(f"Канал {channel['title']} (ID: {channel['id']}) успешно активирован!")
         else:
-            print(f"[LOG] Ошибка: канал {channel_id} не найден в списке.")
+            logger.warning("Ошибка: канал %s не найден в списке.", channel_id)
             await query.message.edit_text("Ошибка: канал не найден.")
         await state.clear()
     
     async def handle_contact_for_deactivate_admin(self, message: types.Message, state: FSMContext):
-        print(f"[LOG] handle_contact_for_deactivate_admin: state={await state.get_state()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("handle_contact_for_deactivate_admin: state=%s", await state.get_state())
         contact = message.contact
         admin_user_id = contact.user_id
-        print(f"[LOG] Получен контакт для управления: user_id={admin_user_id}")
+        logger.debug("Получен контакт для управления: user_id=%s", admin_user_id)
         if not admin_user_id:
             await message.answer("Не удалось получить ID пользователя. Пользователь должен быть в Telegram.", reply_markup=SYSADMIN_MENU)
             await state.clear()
-            print(f"[LOG] FSM: state cleared")
+            logger.debug("FSM: state cleared")
             return
-        # Получаем все чаты, где бот есть
-        async with self.db.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT id, title FROM chats WHERE is_bot_in = TRUE')
-        # Для каждого чата проверяем, есть ли этот админ и его статус
-        admins_status = []
-        for row in rows:
-            chat_id = row['id']
-            title = row['title']
-            admin_row = None
-            async with self.db.pool.acquire() as conn:
-                admin_row = await conn.fetchrow(
-                    'SELECT activated FROM chat_admins WHERE chat_id = $1 AND user_id = $2',
-                    chat_id, admin_user_id
-                )
-            admins_status.append({
-                'chat_id': chat_id,
-                'title': title,
-                'active': bool(admin_row and admin_row['activated'])
-            })
-        await state.update_data(admin_user_id=admin_user_id, admins_status=admins_status, admin_page=0)
-        await self._send_admin_page(message, admins_status, 0, state)
+        await state.update_data(admin_user_id=admin_user_id)
+        await self._send_admin_page(message, admin_user_id, 0, state)
         await state.set_state(BotStates.waiting_for_contact)
-        print(f"[LOG] FSM: set_state -> waiting_for_contact")
-
-    def _build_admin_menu(self, admins_status, page, page_size):
-        start = page * page_size
-        end = start + page_size
-        page_admins = admins_status[start:end]
-        keyboard = []
-        for adm in page_admins:
-            status = "активен" if adm.get('active', False) else "неактивен"
-            btn_text = f"{adm['title']} ({status})"
-            keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"toggle_admin:{adm['chat_id']}")])
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"admin_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(len(admins_status)-1)//page_size+1}", callback_data="noop"))
-        if end < len(admins_status):
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"admin_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
-        return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-    async def _send_admin_page(self, message_or_query, admins_status, page, state):
-        page_size = self.config.ui.page_size
-        markup = self._build_admin_menu(admins_status, page, page_size)
+        logger.debug("FSM: set_state -> waiting_for_contact")
+
+    @staticmethod
+    def _admin_button(adm) -> InlineKeyboardButton:
+        status = _STATUS_ACTIVE if adm.get('active', False) else _STATUS_INACTIVE
+        return InlineKeyboardButton(text=_STATUS_BUTTON_TEXT % (adm['title'], status), callback_data=f"toggle_admin:{adm['chat_id']}")
+
+    async def _send_admin_page(self, message_or_query, admin_user_id, page, state):
+        page_size = self._page_size
+        # Чаты текущей страницы и статус админа в каждом - одним запросом
+        admins_status, has_next = await self.db.get_admin_status_matrix(admin_user_id, page * page_size, page_size)
+        total_pages = self._total_pages(await self._cached_count("bot_chats"))
+        markup = self._build_admin_menu(
+            [self._admin_button(adm) for adm in admins_status], page, total_pages, has_next
+        )
         text = "Выберите чат для активации/деактивации админа:" if admins_status else "Нет доступных чатов."
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(admin_page=page)
+        # В FSM храним только номер страницы, статусы при следующем рендере читаем из БД
+        await self._send_page(message_or_query, text, markup, state, "admin_page", page)
+
+    async def handle_admin_page(self, query: types.CallbackQuery, state: FSMContext):
+        data = await state.get_data()
+        page = int(query.data.split(":")[1])
+        await self._send_admin_page(query, data.get("admin_user_id"), page, state)
+        await query.answer()
 
     async def handle_toggle_admin(self, query: types.CallbackQuery, state: FSMContext):
         data = await state.get_data()
         admin_user_id = data.get("admin_user_id")
-        admins_status = data.get("admins_status", [])
         page = data.get("admin_page", 0)
         chat_id = int(query.data.split(":")[1])
-        # Найти текущий статус
-        current = next((a for a in admins_status if a['chat_id'] == chat_id), None)
-        if not current:
+        # Состояние могло истечь или быть сброшено
+        if admin_user_id is None:
             await query.answer("Чат не найден")
             return
-        if current['active']:
-            # Деактивировать (удалить из chat_admins)
-            async with self.db.pool.acquire() as conn:
-                await conn.execute('DELETE FROM chat_admins WHERE chat_id = $1 AND user_id = $2', chat_id, admin_user_id)
-            current['active'] = False
-        else:
-            # Активировать (добавить в chat_admins)
+        # Снимаем активного админа (удаляем из chat_admins), а если снимать нечего - активируем,
+        # но только в чате из списка, то есть в чате, где есть бот
+        if not await self.db.remove_active_admin(chat_id, admin_user_id):
+            if not await self.db.is_bot_chat(chat_id):
+                await query.answer("Чат не найден")
+                return
             await self.db.add_admin(chat_id, admin_user_id)
-            current['active'] = True
-        await self._send_admin_page(query, admins_status, page, state)
+        self.invalidate_role(admin_user_id)
+        self.invalidate_counts()
+        await self._send_admin_page(query, admin_user_id, page, state)
         await query.answer()
 
     async def handle_deactivate_channel_page(self, message_or_query, state: FSMContext):
-        data = await state.get_data()
-        chats = data.get("deact_chats", [])
-        page = data.get("deact_page", 0)
-        page_size = self.config.ui.page_size
-        start = page * page_size
-        end = start + page_size
-        page_chats = chats[start:end]
-        keyboard = []
-        for ch in page_chats:
-            keyboard.append([InlineKeyboardButton(text=ch['title'], callback_data=f"deact_channel:{ch['id']}")])
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"deact_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(len(chats)-1)//page_size+1}", callback_data="noop"))
-        if end < len(chats):
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"deact_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-        text = "Выберите канал для деактивации:" if chats else "Нет доступных каналов."
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
+        if isinstance(message_or_query, types.CallbackQuery):
+            page = int(message_or_query.data.split(":")[1])
         else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(deact_page=page)
+            page = 0
+        await self._send_deactivate_channel_page(message_or_query, page, state)
+        if isinstance(message_or_query, types.CallbackQuery):
+            await message_or_query.answer()
     
     async def handle_deactivate_channel_select(self, query: types.CallbackQuery, state: FSMContext):
         channel_id = int(query.data.split(":")[1])
         await self.db.deactivate_chat(channel_id)
+        # Роли зависят от активности чата, поэтому сбрасываем весь кэш
+        self.invalidate_role()
+        self.invalidate_counts()
         await query.message.edit_text(f"Канал {channel_id} деактивирован.")
         await state.clear()
     
@@ -715,56 +906,43 @@ class TelegramBot:
         chat = event.chat
         new_status = event.new_chat_member.status
         old_status = event.old_chat_member.status
-        print(f"[LOG] handle_my_chat_member: chat_id={chat.id}, title={chat.title}, old_status={old_status}, new_status={new_status}")
-        print(f"[LOG] event.new_chat_member: {event.new_chat_member}")
-        print(f"[LOG] can_read_all_group_messages: {getattr(event.new_chat_member, 'can_read_all_group_messages', None)}")
-        print(f"[LOG] can_restrict_members: {getattr(event.new_chat_member, 'can_restrict_members', None)}")
-        print(f"[LOG] is_anonymous: {getattr(event.new_chat_member, 'is_anonymous', None)}")
-        print(f"[LOG] custom_title: {getattr(event.new_chat_member, 'custom_title', None)}")
-        print(f"[LOG] privileges: {event.new_chat_member.__dict__ if hasattr(event.new_chat_member, '__dict__') else str(event.new_chat_member)}")
+        logger.debug("handle_my_chat_member: chat_id=%s, title=%s, old_status=%s, new_status=%s", chat.id, chat.title, old_status, new_status)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("event.new_chat_member: %s", event.new_chat_member)
+            logger.debug("can_read_all_group_messages: %s", getattr(event.new_chat_member, 'can_read_all_group_messages', None))
+            logger.debug("can_restrict_members: %s", getattr(event.new_chat_member, 'can_restrict_members', None))
+            logger.debug("is_anonymous: %s", getattr(event.new_chat_member, 'is_anonymous', None))
+            logger.debug("custom_title: %s", getattr(event.new_chat_member, 'custom_title', None))
+            logger.debug("privileges: %s", event.new_chat_member.__dict__ if hasattr(event.new_chat_member, '__dict__') else str(event.new_chat_member))
         can_read = getattr(event.new_chat_member, "can_read_all_group_messages", None)
         can_read_messages = (can_read is None) or (can_read is True)
         can_restrict = getattr(event.new_chat_member, "can_restrict_members", False)
         if new_status == "administrator" and old_status != "administrator":
-            print(f"[LOG] Бот стал админом в чате {chat.id} ('{chat.title}')")
-            for sysadmin_id in self.config.admin.sysadmin_ids:
-                try:
-                    await self.bot.send_message(
-                        sysadmin_id,
-                        f"Бот был добавлен администратором в чат '{chat.title}' (ID: {chat.id})"
-                    )
-                except Exception as e:
-                    print(f"[LOG] Ошибка отправки уведомления сисадмину {sysadmin_id}: {e}")
+            logger.info("Бот стал админом в чате %s ('%s')", chat.id, chat.title)
+            await self._notify_sysadmins(f"Бот был добавлен администратором в чат '{chat.title}' (ID: {chat.id})")
             await self.db.add_chat(chat.id, chat.title or "", activated=True, can_read_messages=can_read_messages, can_restrict_members=can_restrict, is_bot_in=True)
-            print(f"[LOG] Чат {chat.id} ('{chat.title}') добавлен/активирован в базе.")
+            logger.info("Чат %s ('%s') добавлен/активирован в базе.", chat.id, chat.title)
             # Получаем и сохраняем всех админов чата
             try:
                 admins = await self.bot.get_chat_administrators(chat.id)
-                for admin in admins:
-                    # Сохраняем данные пользователя
-                    username = getattr(admin.user, 'username', None)
-                    full_name = admin.user.first_name
-                    if getattr(admin.user, 'last_name', None):
-                        full_name += f" {admin.user.last_name}"
-                    await self.db.add_or_update_user(admin.user.id, username, full_name)
-                    # Добавляем админа как неактивного
-                    await self.db.add_admin(chat.id, admin.user.id, activated=False)
-                    print(f"[LOG] (auto) Добавлен админ user_id={admin.user.id} в chat_admins для чата {chat.id} (неактивный)")
+                # Всех админов сохраняем одним пакетом: пользователи и неактивные записи chat_admins
+                await self.db.bulk_add_admins_with_users(chat.id, [
+                    (
+                        admin.user.id,
+                        getattr(admin.user, 'username', None),
+                        admin.user.first_name + (f" {admin.user.last_name}" if getattr(admin.user, 'last_name', None) else "")
+                    )
+                    for admin in admins
+                ])
+                logger.info("(auto) Добавлено %s админов в chat_admins для чата %s (неактивные)", len(admins), chat.id)
             except Exception as e:
-                print(f"[LOG] Ошибка при получении админов чата {chat.id}: {e}")
+                logger.error("Ошибка при получении админов чата %s: %s", chat.id, e)
         elif new_status in ("administrator", "member"):
             await self.db.add_chat(chat.id, chat.title or "", activated=True, can_read_messages=can_read_messages, can_restrict_members=can_restrict, is_bot_in=True)
-            print(f"[LOG] Чат {chat.id} ('{chat.title}') обновлён/активирован в базе.")
+            logger.info("Чат %s ('%s') обновлён/активирован в базе.", chat.id, chat.title)
         elif new_status in ("left", "kicked"):
-            print(f"[LOG] Бот удалён или потерял права в чате {chat.id} ('{chat.title}')")
-            for sysadmin_id in self.config.admin.sysadmin_ids:
-                try:
-                    await self.bot.send_message(
-                        sysadmin_id,
-                        f"Бот был удалён или потерял права в чате '{chat.title}' (ID: {chat.id})"
-                    )
-                except Exception as e:
-                    print(f"[LOG] Ошибка отправки уведомления сисадмину {sysadmin_id}: {e}")
+            logger.info("Бот удалён или потерял права в чате %s ('%s')", chat.id, chat.title)
+            await self._notify_sysadmins(f"Бот был удалён или потерял права в чате '{chat.title}' (ID: {chat.id})")
             await self.db.add_chat(
                 chat.id,
                 chat.title or "",
@@ -773,7 +951,18 @@ class TelegramBot:
                 can_restrict_members=False,
                 is_bot_in=False
             )
-            print(f"[LOG] Чат {chat.id} ('{chat.title}') деактивирован и is_bot_in=False в базе.")
+            logger.info("Чат %s ('%s') деактивирован и is_bot_in=False в базе.", chat.id, chat.title)
+        self.invalidate_counts()
+
+    async def _notify_sysadmin(self, sysadmin_id: int, text: str) -> None:
+        try:
+            await self.bot.send_message(sysadmin_id, text)
+        except Exception as e:
+            logger.error("Ошибка отправки уведомления сисадмину %s: %s", sysadmin_id, e)
+
+    async def _notify_sysadmins(self, text: str) -> None:
+        """Рассылает уведомление всем сисадминам параллельно."""
+        await asyncio.gather(*(self._notify_sysadmin(sid, text) for sid in self.config.admin.sysadmin_ids))
 
     async def handle_chat_member(self, event: types.ChatMemberUpdated):
         """Обработчик изменения прав участника чата."""
@@ -782,47 +971,49 @@ class TelegramBot:
         old_status = event.old_chat_member.status
         new_status = event.new_chat_member.status
         
-        print(f"[LOG] handle_chat_member: chat_id={chat_id}, user_id={user_id}, old_status={old_status}, new_status={new_status}")
+        logger.debug("handle_chat_member: chat_id=%s, user_id=%s, old_status=%s, new_status=%s", chat_id, user_id, old_status, new_status)
         
         # Проверяем, является ли пользователь модератором в этом чате
-        async with self.db.pool.acquire() as conn:
-            is_moderator = await conn.fetchval(
-                'SELECT 1 FROM chat_moderators WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE',
-                chat_id, user_id
-            )
+        is_moderator = await self.db.user_is_moderator_in_chat(user_id, chat_id)
+        
+        if is_moderator:
+            # Если пользователь был модератором и потерял права
+            if old_status in ['administrator', 'member'] and new_status not in ['administrator', 'member']:
+                logger.info("Модератор %s потерял права в чате %s", user_id, chat_id)
+                await self.db.update_moderator_status(chat_id, user_id, False)
+                self.invalidate_role(user_id)
+                self.invalidate_counts()
+                return
             
-            if is_moderator:
-                # Если пользователь был модератором и потерял права
-                if old_status in ['administrator', 'member'] and new_status not in ['administrator', 'member']:
-                    print(f"[LOG] Модератор {user_id} потерял права в чате {chat_id}")
-                    await self.db.update_moderator_status(chat_id, user_id, False)
-                    return
-                
-                # Если пользователь был модератором и получил права админа
-                if old_status not in ['administrator'] and new_status == 'administrator':
-                    print(f"[LOG] Модератор {user_id} получил права админа в чате {chat_id}")
-                    # Не деактивируем модератора, так как он может быть и админом, и модератором
-                    return
-                
-                # Если пользователь был админом и потерял права админа, но остался участником
-                if old_status == 'administrator' and new_status == 'member':
-                    print(f"[LOG] Админ {user_id} стал обычным участником в чате {chat_id}")
-                    # Не деактивируем модератора, так как он может быть модератором без прав админа
-                    return
-        
+            # Если пользователь был модератором и получил права админа
+            if old_status not in ['administrator'] and new_status == 'administrator':
+                logger.info("Модератор %s получил права админа в чате %s", user_id, chat_id)
+                # Не деактивируем модератора, так как он может быть и админом, и модератором
+                return
+            
+            # Если пользователь был админом и потерял права админа, но остался участником
+            if old_status == 'administrator' and new_status == 'member':
+                logger.info("Админ %s стал обычным участником в чате %s", user_id, chat_id)
+                # Не деактивируем модератора, так как он может быть модератором без прав админа
+                return
+    
         # Проверяем, является ли пользователь админом в этом чате
         is_admin = await self.db.user_is_admin_in_chat(user_id, chat_id)
         if is_admin:
             # Если пользователь был админом и потерял права
             if old_status == 'administrator' and new_status != 'administrator':
-                print(f"[LOG] Админ {user_id} потерял права в чате {chat_id}")
+                logger.info("Админ %s потерял права в чате %s", user_id, chat_id)
                 await self.db.update_admin_status(chat_id, user_id, False)
+                self.invalidate_role(user_id)
+                self.invalidate_counts()
                 return
             
             # Если пользователь был админом и получил права обратно
             if old_status != 'administrator' and new_status == 'administrator':
-                print(f"[LOG] Админ {user_id} получил права обратно в чате {chat_id}")
+                logger.info("Админ %s получил права обратно в чате %s", user_id, chat_id)
                 await self.db.update_admin_status(chat_id, user_id, True)
+                self.invalidate_role(user_id)
+                self.invalidate_counts()
                 return
 
     async def handle_activate_channel_cmd(self, query: types.CallbackQuery, state: FSMContext):
@@ -834,59 +1025,74 @@ class TelegramBot:
 
     async def handle_toggle_channel(self, query: types.CallbackQuery, state: FSMContext):
         channel_id = int(query.data.split(":")[1])
-        # Получаем текущий статус
-        async with self.db.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT activated, title FROM chats WHERE id = $1', channel_id)
-            if not row:
-                await query.answer("Канал не найден")
-                return
-            new_status = not row['activated']
-            await self.db.add_chat(channel_id, row['title'], activated=new_status, is_bot_in=True)
-        # Обновляем клавиатуру
-        data = await state.get_data()
-        chats = await self.db.get_all_chats()
-        page = data.get("page", 0)
-        # Обновляем статус в списке
-        for ch in chats:
-            if ch['id'] == channel_id:
-                ch['activated'] = new_status
-        markup = self._build_channels_menu(chats, page, len(chats), self.config.ui.page_size)
-        text = "Список всех каналов:" if chats else "Нет каналов."
-        # Проверяем, изменился ли статус
-        if row['activated'] == new_status:
-            await query.answer("Статус канала не изменился.")
+        # Чтение и запись статуса - одним UPDATE ... RETURNING, без гонки между ними
+        if await self.db.toggle_chat_activated(channel_id) is None:
+            await query.answer("Канал не найден")
             return
-        if isinstance(query, types.CallbackQuery):
-            await query.message.edit_text(text, reply_markup=markup)
+        self.invalidate_role()
+        self.invalidate_counts()
+        # Перерисовываем текущую страницу списка каналов
+        data = await state.get_data()
+        await self._send_channels_page(query, data.get("channel_page", 0), state)
         await query.answer()
 
-    async def _send_deactivate_channel_page(self, message_or_query, chats, page, state):
-        page_size = self.config.ui.page_size
-        start = page * page_size
-        end = start + page_size
-        page_chats = chats[start:end]
-        keyboard = []
-        for ch in page_chats:
-            keyboard.append([InlineKeyboardButton(text=ch['title'], callback_data=f"deact_channel:{ch['id']}")])
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"deact_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(len(chats)-1)//page_size+1}", callback_data="noop"))
-        if end < len(chats):
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"deact_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    async def _send_deactivate_channel_page(self, message_or_query, page, state):
+        page_size = self._page_size
+        chats, has_next = await self.db.get_chats_page(page * page_size, page_size, activated_only=True)
+        total = await self._cached_count("active_chats")
+        markup = self._build_deact_menu(chats, page, self._total_pages(total), has_next)
         text = "Выберите канал для деактивации:" if chats else "Нет доступных каналов."
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(deact_page=page)
+        await self._send_page(message_or_query, text, markup, state, "deact_page", page)
+
+    @_memoized_menu(lambda chats, page, total_pages, has_next: (
+        page, total_pages, has_next, tuple((c['id'], c['title']) for c in chats)
+    ))
+    def _build_deact_menu(self, chats, page, total_pages, has_next):
+        """Строит меню выбора канала для деактивации."""
+        keyboard = [
+            [InlineKeyboardButton(text=ch['title'], callback_data=f"deact_channel:{ch['id']}")]
+            for ch in chats
+        ]
+        keyboard.append(_nav_row("deact_page", page, total_pages, has_next))
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    @staticmethod
+    def _is_same_render(message, text, markup) -> bool:
+        """Проверяет, что сообщение уже показывает этот текст и клавиатуру (Telegram отклонит такую правку)."""
+        current = getattr(message, "reply_markup", None)
+        return (
+            getattr(message, "text", None) == text
+            and current is not None
+            and current.model_dump(exclude_none=True) == markup.model_dump(exclude_none=True)
+        )
+
+    async def _answer_new(self, message: types.Message, text, markup) -> None:
+        """Показывает страницу новым сообщением (вход из команды или меню)."""
+        await message.answer(text, reply_markup=markup)
+
+    async def _edit_existing(self, query: types.CallbackQuery, text, markup) -> None:
+        """Показывает страницу правкой сообщения с кнопками (вход из колбэка)."""
+        if not self._is_same_render(query.message, text, markup):
+            await query.message.edit_text(text, reply_markup=markup)
 
-    async def debug_log_message(self, message: types.Message):
-        # print(f"[DEBUG] RAW MESSAGE: {message.model_dump_json() if hasattr(message, 'model_dump_json') else str(message)}")
-        pass
+    @functools.singledispatchmethod
+    async def _deliver(self, target, text, markup) -> None:
+        """Показывает страницу способом, зависящим от типа входа (сообщение или колбэк)."""
+        raise TypeError(f"Страницу можно показать только для Message или CallbackQuery, получен {type(target).__name__}")
+
+    @_deliver.register(types.Message)
+    async def _(self, target, text, markup) -> None:
+        await self._answer_new(target, text, markup)
+
+    @_deliver.register(types.CallbackQuery)
+    async def _(self, target, text, markup) -> None:
+        await self._edit_existing(target, text, markup)
+
+    async def _send_page(self, message_or_query, text, markup, state=None, state_key=None, page=None):
+        """Отправляет или редактирует страницу и запоминает номер страницы в FSM."""
+        await self._deliver(message_or_query, text, markup)
+        if state_key is not None:
+            await state.update_data({state_key: page})
 
     async def start(self):
         """Запуск бота"""
@@ -894,122 +1100,103 @@ class TelegramBot:
 
     async def _send_admins_page(self, message_or_query, page, state):
         """Отправляет страницу со списком админов."""
-        print(f"[LOG] _send_admins_page: page={page}")
-        page_size = self.config.ui.page_size
-        print(f"[LOG] page_size={page_size}")
+        logger.debug("_send_admins_page: page=%s", page)
+        page_size = self._page_size
+        logger.debug("page_size=%s", page_size)
         users = await self.db.get_all_users(page * page_size, page_size)
-        print(f"[LOG] Получено пользователей: {len(users)}")
-        total = await self.db.get_users_count()
-        print(f"[LOG] Всего пользователей: {total}")
-        markup = self._build_admins_menu(users, page, total, page_size)
+        logger.debug("Получено пользователей: %s", len(users))
+        total = await self._cached_count("users")
+        logger.debug("Всего пользователей: %s", total)
+        markup = self._build_admins_menu(users, page, self._total_pages(total))
         text = "Список всех администраторов:" if users else "Нет администраторов."
-        if isinstance(message_or_query, types.Message):
-            print(f"[LOG] Отправляем сообщение пользователю")
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            print(f"[LOG] Редактируем сообщение")
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(admin_page=page)
-        print(f"[LOG] FSM: update_data admin_page={page}")
+        await self._send_page(message_or_query, text, markup, state, "admin_page", page)
+        logger.debug("FSM: update_data admin_page=%s", page)
 
     async def _send_channels_page(self, message_or_query, page, state):
         """Отправляет страницу со списком каналов."""
-        print(f"[LOG] _send_channels_page: page={page}")
-        page_size = self.config.ui.page_size
-        print(f"[LOG] page_size={page_size}")
-        chats = await self.db.get_all_chats()
-        print(f"[LOG] Получено чатов: {len(chats)}")
-        total = len(chats)
-        markup = self._build_channels_menu(chats, page, total, page_size)
+        logger.debug("_send_channels_page: page=%s", page)
+        page_size = self._page_size
+        logger.debug("page_size=%s", page_size)
+        chats, has_next = await self.db.get_chats_page(page * page_size, page_size)
+        logger.debug("Получено чатов: %s", len(chats))
+        total = await self._cached_count("chats")
+        markup = self._build_channels_menu(chats, page, self._total_pages(total), has_next)
         text = "Список всех каналов:" if chats else "Нет каналов."
-        if isinstance(message_or_query, types.Message):
-            print(f"[LOG] Отправляем сообщение пользователю")
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            print(f"[LOG] Редактируем сообщение")
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(channel_page=page)
-        print(f"[LOG] FSM: update_data channel_page={page}")
+        await self._send_page(message_or_query, text, markup, state, "channel_page", page)
+        logger.debug("FSM: update_data channel_page=%s", page)
 
-    def _build_admins_menu(self, users, page, total, page_size):
+    @_memoized_menu(lambda users, page, total_pages: (
+        page, total_pages, tuple((u['username'], u['full_name']) for u in users)
+    ))
+    def _build_admins_menu(self, users, page, total_pages):
         """Строит меню для списка админов."""
         keyboard = []
         for user in users:
-            username = user['username'] or 'Нет username'
-            full_name = user['full_name'] or 'Нет имени'
-            btn_text = f"{full_name} (@{username})"
+            btn_text = _USER_BUTTON_TEXT % (user['full_name'] or 'Нет имени', user['username'] or 'Нет username')
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data="noop")])
         
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"admins_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(total-1)//page_size+1}", callback_data="noop"))
-        if (page + 1) * page_size < total:
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"admins_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+        keyboard.append(_nav_row("admins_page", page, total_pages, page + 1 < total_pages))
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    def _build_channels_menu(self, chats, page, total, page_size):
+    @_memoized_menu(lambda chats, page, total_pages, has_next: (
+        page, total_pages, has_next, tuple((c['id'], c['title'], c.get('activated', True)) for c in chats)
+    ))
+    def _build_channels_menu(self, chats, page, total_pages, has_next):
         """Строит меню для списка каналов."""
         keyboard = []
         for chat in chats:
-            status = "активен" if chat.get('activated', True) else "неактивен"
-            btn_text = f"{chat['title']} ({status})"
+            status = _STATUS_ACTIVE if chat.get('activated', True) else _STATUS_INACTIVE
+            btn_text = _STATUS_BUTTON_TEXT % (chat['title'], status)
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"toggle_channel:{chat['id']}")])
         
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"channels_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(total-1)//page_size+1}", callback_data="noop"))
-        if (page + 1) * page_size < total:
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"channels_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+        keyboard.append(_nav_row("channels_page", page, total_pages, has_next))
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
     async def handle_admins_page(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик переключения страниц списка админов."""
-        print(f"[LOG] handle_admins_page: user_id={query.from_user.id}, data={query.data}")
+        logger.debug("handle_admins_page: user_id=%s, data=%s", query.from_user.id, query.data)
         page = int(query.data.split(":")[1])
-        print(f"[LOG] Переключение на страницу {page}")
+        logger.debug("Переключение на страницу %s", page)
         await self._send_admins_page(query, page, state)
         await query.answer()
 
     async def handle_channels_page(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик переключения страниц списка каналов."""
-        print(f"[LOG] handle_channels_page: user_id={query.from_user.id}, data={query.data}")
+        logger.debug("handle_channels_page: user_id=%s, data=%s", query.from_user.id, query.data)
         page = int(query.data.split(":")[1])
-        print(f"[LOG] Переключение на страницу {page}")
+        logger.debug("Переключение на страницу %s", page)
         await self._send_channels_page(query, page, state)
         await query.answer()
 
     async def handle_moderator_menu(self, message: types.Message, state: FSMContext):
         user_id = message.from_user.id
-        print(f"[LOG] handle_moderator_menu: user_id={user_id}")
+        logger.debug("handle_moderator_menu: user_id=%s", user_id)
         admin_chats = await self.db.get_moderator_chats_for_user(user_id)
-        print(f"[LOG] admin_chats: {admin_chats}")
+        logger.debug("admin_chats: %s", admin_chats)
         if not admin_chats:
             await message.answer("У вас нет каналов, где вы являетесь активным админом.", reply_markup=ADMIN_MENU)
-            print(f"[LOG] Нет доступных каналов для админа")
+            logger.debug("Нет доступных каналов для админа")
             return
         await message.answer(
             "Перешлите контакт пользователя, которого хотите назначить модератором (или снять).",
             reply_markup=ADMIN_MENU
         )
-        print(f"[LOG] Инструкция по пересылке контакта модератора отправлена")
-        print(f"[LOG] FSM перед set_state: {await state.get_state()}")
+        logger.debug("Инструкция по пересылке контакта модератора отправлена")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("FSM перед set_state: %s", await state.get_state())
         await state.set_state(BotStates.waiting_for_contact)
         await state.update_data(action_type='moderator_management')
-        print(f"[LOG] FSM после set_state: {await state.get_state()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("FSM после set_state: %s", await state.get_state())
 
     async def handle_contact_for_moderator(self, message: types.Message, state: FSMContext):
-        print(f"[LOG] handle_contact_for_moderator: state={await state.get_state()} (Ожидаем: waiting_for_contact)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("handle_contact_for_moderator: state=%s (Ожидаем: waiting_for_contact)", await state.get_state())
         contact = message.contact
         moderator_user_id = contact.user_id
-        print(f"[LOG] Получен контакт модератора: user_id={moderator_user_id}")
+        logger.debug("Получен контакт модератора: user_id=%s", moderator_user_id)
         username = contact.username if hasattr(contact, 'username') else None
         full_name = contact.first_name
         if contact.last_name:
@@ -1017,69 +1204,50 @@ class TelegramBot:
         user_exists = await self.db.user_exists(moderator_user_id)
         if not user_exists:
             await self.db.add_or_update_user(moderator_user_id, username, full_name)
-            print(f"[LOG] Данные модератора сохранены в БД")
+            logger.debug("Данные модератора сохранены в БД")
         else:
-            print(f"[LOG] Модератор уже есть в users, не обновляем запись")
+            logger.debug("Модератор уже есть в users, не обновляем запись")
         user_id = message.from_user.id
         admin_chats = await self.db.get_moderator_chats_for_user(user_id)
-        print(f"[LOG] admin_chats для админа: {admin_chats}")
+        logger.debug("admin_chats для админа: %s", admin_chats)
         if not admin_chats:
             await message.answer("У вас нет каналов для назначения модератора.", reply_markup=ADMIN_MENU)
-            print(f"[LOG] Нет доступных каналов для назначения модератора")
+            logger.debug("Нет доступных каналов для назначения модератора")
             return
-        await state.update_data(selected_moderator_user_id=moderator_user_id, mod_channels=admin_chats, mod_page=0)
-        print(f"[LOG] FSM: update_data selected_moderator_user_id={moderator_user_id}, mod_channels={admin_chats}, mod_page=0")
+        # Список каналов в FSM не кладём - при листании он читается из БД заново
+        await state.update_data(selected_moderator_user_id=moderator_user_id, mod_page=0)
+        logger.debug("FSM: update_data selected_moderator_user_id=%s, mod_page=0", moderator_user_id)
         await self._send_moderator_channel_page(message, admin_chats, 0, state)
         await state.set_state(BotStates.waiting_for_moderator_channel_selection)
 
     async def _send_moderator_channel_page(self, message_or_query, channels, page, state):
-        print(f"[LOG] _send_moderator_channel_page: page={page}, channels={channels}")
-        page_size = self.config.ui.page_size
+        logger.debug("_send_moderator_channel_page: page=%s, channels=%s", page, channels)
+        page_size = self._page_size
         start = page * page_size
-        end = start + page_size
-        page_channels = channels[start:end]
+        page_channels = channels[start:start + page_size]
         data = await state.get_data()
         moderator_user_id = data.get("selected_moderator_user_id")
-        statuses = []
-        for ch in page_channels:
-            async with self.db.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT activated FROM chat_moderators WHERE chat_id = $1 AND user_id = $2',
-                    ch['id'], moderator_user_id
-                )
-            statuses.append({
-                'chat_id': ch['id'],
-                'title': ch['title'],
-                'active': bool(row and row['activated'])
-            })
-        print(f"[LOG] Статусы модератора по каналам: {statuses}")
+        # Статусы по всем каналам страницы - одним запросом
+        active_by_chat = await self.db.get_moderator_statuses(moderator_user_id, [ch['id'] for ch in page_channels])
+        statuses = [
+            {'chat_id': ch['id'], 'title': ch['title'], 'active': bool(active_by_chat.get(ch['id']))}
+            for ch in page_channels
+        ]
+        logger.debug("Статусы модератора по каналам: %s", statuses)
         keyboard = []
         for st in statuses:
-            status = "активен" if st['active'] else "неактивен"
-            btn_text = f"{st['title']} ({status})"
+            status = _STATUS_ACTIVE if st['active'] else _STATUS_INACTIVE
+            btn_text = _STATUS_BUTTON_TEXT % (st['title'], status)
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"toggle_moderator:{st['chat_id']}")])
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"mod_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(len(channels)-1)//page_size+1}", callback_data="noop"))
-        if end < len(channels):
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"mod_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+        total_pages = self._total_pages(len(channels))
+        keyboard.append(_nav_row("mod_page", page, total_pages, page + 1 < total_pages))
         markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
         text = "Выберите канал для назначения/деактивации модератора:" if statuses else "Нет доступных каналов."
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-            print(f"[LOG] Инструкция по выбору канала отправлена")
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-            print(f"[LOG] Инструкция по выбору канала обновлена")
-        await state.update_data(mod_page=page)
-        print(f"[LOG] FSM: update_data mod_page={page}")
+        await self._send_page(message_or_query, text, markup, state, "mod_page", page)
+        logger.debug("FSM: update_data mod_page=%s", page)
 
     async def handle_moderator_channel_page(self, query: types.CallbackQuery, state: FSMContext):
-        data = await state.get_data()
-        channels = data.get("mod_channels", [])
+        channels = await self.db.get_moderator_chats_for_user(query.from_user.id)
         page = int(query.data.split(":")[1])
         await self._send_moderator_channel_page(query, channels, page, state)
         await query.answer()
@@ -1087,26 +1255,17 @@ class TelegramBot:
     async def handle_moderator_channel_select(self, query: types.CallbackQuery, state: FSMContext):
         data = await state.get_data()
         moderator_user_id = data.get("selected_moderator_user_id")
-        channels = data.get("mod_channels", [])
         page = data.get("mod_page", 0)
         chat_id = int(query.data.split(":")[1])
-        # Проверяем, что пользователь-инициатор админ в этом чате
-        user_id = query.from_user.id
-        is_admin = await self.db.user_is_admin_in_chat(user_id, chat_id)
-        if not is_admin:
+        # Переключаем статус, только если инициатор - админ в этом чате
+        new_status = await self.db.toggle_moderator_if_admin(query.from_user.id, moderator_user_id, chat_id)
+        if new_status is None:
             await query.answer("Нет прав на управление этим каналом.")
             return
-        # Получаем текущий статус
-        async with self.db.pool.acquire() as conn:
-            row = await conn.fetchrow('SELECT activated FROM chat_moderators WHERE chat_id = $1 AND user_id = $2', chat_id, moderator_user_id)
-        current_active = bool(row and row['activated'])
-        if current_active:
-            # Деактивировать
-            await self.db.update_moderator_status(chat_id, moderator_user_id, False)
-        else:
-            # Активировать
-            await self.db.add_moderator(chat_id, moderator_user_id, activated=True)
+        self.invalidate_role(moderator_user_id)
+        self.invalidate_counts()
         # Обновить страницу
+        channels = await self.db.get_moderator_chats_for_user(query.from_user.id)
         await self._send_moderator_channel_page(query, channels, page, state)
         await query.answer()
 
@@ -1117,36 +1276,25 @@ class TelegramBot:
 
     async def _send_moderators_page(self, message_or_query, page, state):
         """Отправляет страницу со списком модераторов."""
-        page_size = self.config.ui.page_size
-        total = await self.db.get_moderators_count()
+        page_size = self._page_size
+        total = await self._cached_count("moderators")
         users = await self.db.get_all_moderators(page * page_size, page_size)
         
-        markup = self._build_moderators_menu(users, page, total, page_size)
+        markup = self._build_moderators_menu(users, page, self._total_pages(total))
         text = "Список модераторов:" if users else "Нет активных модераторов."
-        
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-        await state.update_data(page=page)
+        await self._send_page(message_or_query, text, markup, state, "page", page)
 
-    def _build_moderators_menu(self, users, page, total, page_size):
+    @_memoized_menu(lambda users, page, total_pages: (
+        page, total_pages, tuple((u['user_id'], u['username'], u['full_name']) for u in users)
+    ))
+    def _build_moderators_menu(self, users, page, total_pages):
         """Строит меню со списком модераторов."""
         keyboard = []
         for user in users:
-            username = user['username'] or 'Нет username'
-            full_name = user['full_name'] or 'Нет имени'
-            btn_text = f"{full_name} (@{username})"
+            btn_text = _USER_BUTTON_TEXT % (user['full_name'] or 'Нет имени', user['username'] or 'Нет username')
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"moderator:{user['user_id']}")])
         
-        nav = []
-        if page > 0:
-            nav.append(InlineKeyboardButton("⬅️", callback_data=f"moderators_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{(total-1)//page_size+1}", callback_data="noop"))
-        if (page + 1) * page_size < total:
-            nav.append(InlineKeyboardButton("➡️", callback_data=f"moderators_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+        keyboard.append(_nav_row("moderators_page", page, total_pages, page + 1 < total_pages))
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -1157,10 +1305,10 @@ class TelegramBot:
         await query.answer()
 
     async def debug_contact(self, message: types.Message):
-        print("[DEBUG] debug_contact сработал!", message)
+        logger.debug("debug_contact сработал! %s", message)
 
     async def debug_any(self, message: types.Message):
-        print("[DEBUG] debug_any:", message.model_dump_json() if hasattr(message, 'model_dump_json') else str(message))
+        logger.debug("debug_any: %s", message)
 
     def _build_log_channels_menu(self, channels):
         keyboard = [
@@ -1177,11 +1325,13 @@ class TelegramBot:
             moderator_name = violation.get('moderator_username') or violation.get('moderator_full_name') or "Неизвестный"
             violator_name = violation.get('violator_username') or violation.get('violator_full_name') or "Публичный тег"
             # Обрезаем текст сообщения до 30 символов и добавляем многоточие, если длиннее
-            message_text = violation.get('message_text', '')[:30] + "..." if len(violation.get('message_text', '')) > 30 else violation.get('message_text', '')
+            message_text = violation.get('message_text') or ''
+            if len(message_text) > _MESSAGE_PREVIEW_LEN:
+                message_text = message_text[:_MESSAGE_PREVIEW_LEN] + "..."
             
             keyboard.append([
                 InlineKeyboardButton(
-                    text=f"{moderator_name} | {action_text} | {message_text} | {violator_name}",
+                    text=_VIOLATION_BUTTON_TEXT % (moderator_name, action_text, message_text, violator_name),
                     callback_data=f"log_violation:{violation['id']}"
                 )
             ])
@@ -1197,9 +1347,7 @@ class TelegramBot:
     async def handle_logs_entry(self, message: types.Message, state: FSMContext):
         user_id = message.from_user.id
         # Получаем каналы, где пользователь модератор или админ
-        channels = await self.db.get_user_moderator_chats(user_id)
-        if not channels:
-            channels = await self.db.get_moderator_chats_for_user(user_id)
+        channels = await self.db.get_moderator_or_admin_chats(user_id)
         if not channels:
             await message.answer("У вас нет каналов для просмотра логов.")
             return
@@ -1211,16 +1359,8 @@ class TelegramBot:
         channel_id = int(query.data.split(":")[1])
         user_id = query.from_user.id
         
-        # Проверяем, является ли пользователь модератором
-        is_moderator = await self.db.is_chat_moderator(channel_id, user_id)
-        
-        # Получаем последние 10 нарушений с решениями модератора
-        violations = await self.db.get_chat_decisions(
-            channel_id, 
-            0, 
-            10, 
-            moderator_id=user_id if is_moderator else None
-        )
+        # Роль модератора и последние 10 решений (только его, если он модератор) - одним запросом
+        is_moderator, violations = await self.db.get_chat_decisions_with_role(channel_id, user_id, 0, 10)
         
         await state.set_state(BotStates.waiting_for_contact)
         await state.update_data(selected_log_channel=channel_id, log_violations=violations)
@@ -1271,18 +1411,19 @@ class TelegramBot:
             status = 'включено' if p['enabled'] else 'выключено'
             btn_text = f"{p['label']} ({status})"
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"toggle_policy:{p['type']}")])
-        print(f"[LOG] _build_notification_policies_menu: keyboard={keyboard}")
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+    @staticmethod
+    def _notification_policies(statuses: Dict[str, bool]) -> List[Dict]:
+        return [
+            {'type': 'BAN', 'label': 'Баны', 'enabled': statuses['BAN']},
+            {'type': 'NOTIFICATION', 'label': 'Предупреждения', 'enabled': statuses['NOTIFICATION']}
+        ]
+
     async def handle_show_notification_policies(self, message: types.Message, state: FSMContext):
         user_id = message.from_user.id
-        # Получаем статусы политик
-        ban_enabled = await self.db.get_notification_policy_status(user_id, 'BAN')
-        notif_enabled = await self.db.get_notification_policy_status(user_id, 'NOTIFICATION')
-        policies = [
-            {'type': 'BAN', 'label': 'Баны', 'enabled': ban_enabled},
-            {'type': 'NOTIFICATION', 'label': 'Предупреждения', 'enabled': notif_enabled}
-        ]
+        # Статусы обеих политик - одним запросом
+        policies = self._notification_policies(await self.db.get_notification_policy_statuses(user_id))
         await state.set_state(BotStates.waiting_for_notification_policy)
         await message.answer(
             "Ваши политики уведомлений:",
@@ -1292,17 +1433,15 @@ class TelegramBot:
     async def handle_toggle_notification_policy(self, query: types.CallbackQuery, state: FSMContext):
         user_id = query.from_user.id
         policy_type = query.data.split(":")[1]
-        # Получаем текущий статус
-        enabled = await self.db.get_notification_policy_status(user_id, policy_type)
-        # Переключаем
-        await self.db.set_notification_policy_status(user_id, policy_type, not enabled)
-        # Обновляем меню
-        ban_enabled = await self.db.get_notification_policy_status(user_id, 'BAN')
-        notif_enabled = await self.db.get_notification_policy_status(user_id, 'NOTIFICATION')
-        policies = [
-            {'type': 'BAN', 'label': 'Баны', 'enabled': ban_enabled},
-            {'type': 'NOTIFICATION', 'label': 'Предупреждения', 'enabled': notif_enabled}
-        ]
+        # Получаем текущие статусы обеих политик одним запросом
+        statuses = await self.db.get_notification_policy_statuses(user_id)
+        if policy_type not in statuses:
+            await query.answer()
+            return
+        # Переключаем и обновляем меню без повторного чтения
+        statuses[policy_type] = not statuses[policy_type]
+        await self.db.set_notification_policy_status(user_id, policy_type, statuses[policy_type])
+        policies = self._notification_policies(statuses)
         await query.message.edit_text(
             "Ваши политики уведомлений:",
             reply_markup=self._build_notification_policies_menu(policies)
@@ -1331,13 +1470,7 @@ class TelegramBot:
         chat_id = int(query.data.split(":")[1])
         await state.update_data(selected_chat_id=chat_id)
         
-        markup = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="Добавить промпт", callback_data="add_prompt")],
-                [InlineKeyboardButton(text="Список правил", callback_data="list_prompts")]
-            ]
-        )
-        await query.message.edit_text("Выберите действие:", reply_markup=markup)
+        await query.message.edit_text("Выберите действие:", reply_markup=_CHAT_ACTION_MARKUP)
         await query.answer()
 
     async def handle_add_prompt(self, query: types.CallbackQuery, state: FSMContext):
@@ -1351,14 +1484,7 @@ class TelegramBot:
     async def handle_prompt_text(self, message: types.Message, state: FSMContext):
         """Обработка введенного текста промпта."""
         await state.update_data(prompt_text=message.text)
-        markup = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="Бан", callback_data="prompt_type:BAN")],
-                [InlineKeyboardButton(text="Предупреждение модерам", callback_data="prompt_type:NOTIFY")],
-                [InlineKeyboardButton(text="Слежение", callback_data="prompt_type:OBSERVE")]
-            ]
-        )
-        await message.answer("Выберите тип промпта:", reply_markup=markup)
+        await message.answer("Выберите тип промпта:", reply_markup=_PROMPT_TYPE_MARKUP)
         await state.set_state(BotStates.waiting_for_prompt_type)
 
     async def handle_prompt_type(self, query: types.CallbackQuery, state: FSMContext):
@@ -1371,15 +1497,9 @@ class TelegramBot:
             await query.message.edit_text("Введите объяснение для промпта (или отправьте '-' если не нужно):")
             await state.set_state(BotStates.waiting_for_prompt_explanation)
         else:
-            markup = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Тихий (без сообщения в чат)", callback_data="prompt_silent:true")],
-                    [InlineKeyboardButton(text="Обычный (с сообщением в чат)", callback_data="prompt_silent:false")]
-                ]
-            )
             await query.message.edit_text(
                 "Выберите тип уведомления:",
-                reply_markup=markup
+                reply_markup=_PROMPT_SILENT_MARKUP
             )
             await state.set_state(BotStates.waiting_for_prompt_reason)
         await query.answer()
@@ -1426,8 +1546,8 @@ class TelegramBot:
                 is_silent=is_silent
             )
             await message.answer("Промпт успешно добавлен!", reply_markup=ADMIN_MENU)
-        except Exception as e:
-            print(f"[ERROR] Ошибка при добавлении промпта: {e}")
+        except Exception:
+            logger.exception("Ошибка при добавлении промпта")
             await message.answer("Произошла ошибка при добавлении промпта.", reply_markup=ADMIN_MENU)
         
         await state.clear()
@@ -1438,46 +1558,29 @@ class TelegramBot:
         chat_id = data.get("selected_chat_id")
         
         # Получаем первую страницу правил
-        rules = await self.db.get_rules_for_chat(chat_id, 0, self.config.ui.page_size)
-        total_rules = await self.db.get_rules_count_for_chat(chat_id)
+        rules, total_rules = await self.db.get_rules_page(chat_id, 0, self._page_size)
         
         await self._send_rules_page(query, rules, 0, total_rules, state)
         await query.answer()
 
     async def _send_rules_page(self, message_or_query: Union[types.Message, types.CallbackQuery], rules: List[Dict], page: int, total: int, state: FSMContext):
         """Отправляет страницу со списком правил."""
-        keyboard = []
-        for rule in rules:
-            rule_type = {
-                'BAN': '🚫 Бан',
-                'NOTIFY': '⚠️ Уведомление',
-                'OBSERVE': '👀 Слежение'
-            }.get(rule['type'], rule['type'])
-            
-            btn_text = f"{rule_type}: {rule['rule_text'][:30]}..."
-            keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"view_rule:{rule['id']}")])
+        labels = RULE_TYPE_LABELS
+        keyboard = [
+            [InlineKeyboardButton(
+                text=_RULE_BUTTON_TEXT % (labels.get(rule['type'], rule['type']), rule['rule_text'][:30]),
+                callback_data=f"view_rule:{rule['id']}"
+            )]
+            for rule in rules
+        ]
         
         # Добавляем навигацию
-        nav = []
-        total_pages = (total + self.config.ui.page_size - 1) // self.config.ui.page_size
-        
-        if page > 0:
-            nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"rules_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="noop"))
-        if page + 1 < total_pages:
-            nav.append(InlineKeyboardButton(text="➡️", callback_data=f"rules_page:{page+1}"))
-        if nav:
-            keyboard.append(nav)
+        total_pages = self._total_pages(total)
+        keyboard.append(_nav_row("rules_page", page, total_pages, page + 1 < total_pages))
         
         markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
         text = "Список правил:" if rules else "Нет активных правил."
-        
-        if isinstance(message_or_query, types.Message):
-            await message_or_query.answer(text, reply_markup=markup)
-        else:
-            await message_or_query.message.edit_text(text, reply_markup=markup)
-            
-        await state.update_data(rules_page=page)
+        await self._send_page(message_or_query, text, markup, state, "rules_page", page)
 
     async def handle_rules_page(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик пагинации списка правил."""
@@ -1485,8 +1588,7 @@ class TelegramBot:
         chat_id = data.get("selected_chat_id")
         page = int(query.data.split(":")[1])
         
-        rules = await self.db.get_rules_for_chat(chat_id, page * self.config.ui.page_size, self.config.ui.page_size)
-        total_rules = await self.db.get_rules_count_for_chat(chat_id)
+        rules, total_rules = await self.db.get_rules_page(chat_id, page * self._page_size, self._page_size)
         
         await self._send_rules_page(query, rules, page, total_rules, state)
         await query.answer()
@@ -1494,17 +1596,13 @@ class TelegramBot:
     async def handle_view_rule(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик просмотра деталей правила."""
         rule_id = int(query.data.split(":")[1])
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         
         if not rule:
             await query.answer("Правило не найдено")
             return
         
-        rule_type = {
-            'BAN': '🚫 Бан',
-            'NOTIFY': '⚠️ Уведомление',
-            'OBSERVE': '👀 Слежение'
-        }.get(rule['type'], rule['type'])
+        rule_type = RULE_TYPE_LABELS.get(rule['type'], rule['type'])
         
         text = (
             f"Правило #{rule['id']}\n"
@@ -1534,20 +1632,17 @@ class TelegramBot:
         rule_id = int(query.data.split(":")[1])
         
         # Получаем информацию о правиле перед деактивацией
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         if not rule:
             await query.answer("Правило не найдено")
             return
             
         # Деактивируем правило
         await self.db.update_rule_status(rule_id, False)
+        self.invalidate_rule(rule_id)
         
         # Отправляем подтверждение
-        rule_type = {
-            'BAN': '🚫 Бан',
-            'NOTIFY': '⚠️ Уведомление',
-            'OBSERVE': '👀 Слежение'
-        }.get(rule['type'], rule['type'])
+        rule_type = RULE_TYPE_LABELS.get(rule['type'], rule['type'])
         
         await query.message.edit_text(
             f"Правило деактивировано:\n"
@@ -1561,8 +1656,11 @@ class TelegramBot:
         chat_id = data.get("selected_chat_id")
         page = data.get("rules_page", 0)
         
-        rules = await self.db.get_rules_for_chat(chat_id, page * self.config.ui.page_size, self.config.ui.page_size)
-        total_rules = await self.db.get_rules_count_for_chat(chat_id)
+        rules, total_rules = await self.db.get_rules_page(chat_id, page * self._page_size, self._page_size)
+        if not rules and page > 0:
+            # Деактивировали последнее правило на странице - показываем предыдущую
+            page -= 1
+            rules, total_rules = await self.db.get_rules_page(chat_id, page * self._page_size, self._page_size)
         
         await self._send_rules_page(query, rules, page, total_rules, state)
         await query.answer("Правило деактивировано")
@@ -1572,7 +1670,7 @@ class TelegramBot:
         rule_id = int(query.data.split(":")[1])
         
         # Получаем информацию о правиле
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         if not rule:
             await query.answer("Правило не найдено")
             return
@@ -1580,13 +1678,14 @@ class TelegramBot:
         # Сохраняем ID правила в состоянии
         await state.update_data(editing_rule_id=rule_id)
         
-        # Формируем текст сообщения
-        rule_type = {
-            'BAN': '🚫 Бан',
-            'NOTIFY': '⚠️ Уведомление',
-            'OBSERVE': '👀 Слежение'
-        }.get(rule['type'], rule['type'])
-        
+        text, markup = self._render_edit_rule(rule)
+        await query.message.edit_text(text, reply_markup=markup)
+        await query.answer()
+
+    @staticmethod
+    def _render_edit_rule(rule: Dict) -> Tuple[str, InlineKeyboardMarkup]:
+        """Текст и клавиатура меню редактирования правила."""
+        rule_type = RULE_TYPE_LABELS.get(rule['type'], rule['type'])
         text = (
             f"Редактирование правила:\n\n"
             f"Тип: {rule_type}\n"
@@ -1594,28 +1693,12 @@ class TelegramBot:
             f"Объяснение: {rule['explanation_text'] if rule['explanation_text'] else 'Нет'}\n\n"
             f"Выберите, что хотите изменить:"
         )
-        
-        # Создаем клавиатуру с кнопками редактирования
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="◀️ Назад", callback_data=f"view_rule:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Тип", callback_data=f"edit_rule_type:{rule_id}"),
-                InlineKeyboardButton(text="📝 Правило", callback_data=f"edit_rule_text:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Объяснение", callback_data=f"edit_rule_explanation:{rule_id}"),
-            ]
-        ])
-        
-        await query.message.edit_text(text, reply_markup=markup)
-        await query.answer()
+        return text, _edit_rule_markup(rule['id'])
 
     async def handle_edit_rule_type(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик изменения типа правила."""
         rule_id = int(query.data.split(":")[1])
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         if not rule:
             await query.answer("Правило не найдено")
             return
@@ -1647,7 +1730,7 @@ class TelegramBot:
     async def handle_edit_rule_text(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик изменения текста правила."""
         rule_id = int(query.data.split(":")[1])
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         if not rule:
             await query.answer("Правило не найдено")
             return
@@ -1671,7 +1754,7 @@ class TelegramBot:
     async def handle_edit_rule_explanation(self, query: types.CallbackQuery, state: FSMContext):
         """Обработчик изменения объяснения правила."""
         rule_id = int(query.data.split(":")[1])
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         if not rule:
             await query.answer("Правило не найдено")
             return
@@ -1702,14 +1785,17 @@ class TelegramBot:
             return
             
         new_type = query.data.split(":")[1]
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         
         # Обновляем тип правила
         await self.db.update_rule(rule_id, rule['rule_text'], rule['explanation_text'], new_type)
+        self.invalidate_rule(rule_id)
+        rule['type'] = new_type
         
         # Возвращаемся к редактированию
+        text, markup = self._render_edit_rule(rule)
+        await query.message.edit_text(text, reply_markup=markup)
         await query.answer("Тип правила обновлен")
-        await self.handle_edit_rule(query, state)
 
     async def handle_rule_text_edit(self, message: types.Message, state: FSMContext):
         """Обработчик сохранения нового текста правила."""
@@ -1720,10 +1806,12 @@ class TelegramBot:
             return
             
         new_text = message.text
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         
         # Обновляем текст правила
         await self.db.update_rule(rule_id, new_text, rule['explanation_text'], rule['type'])
+        self.invalidate_rule(rule_id)
+        rule['rule_text'] = new_text
         
         # Возвращаемся к редактированию
         await state.clear()
@@ -1731,38 +1819,7 @@ class TelegramBot:
         # Отправляем сообщение об успешном обновлении с меню
         await message.answer("✅ Текст правила успешно обновлен", reply_markup=ADMIN_MENU)
         
-        # Получаем информацию о правиле
-        rule = await self.db.get_rule_details(rule_id)
-        
-        # Формируем текст сообщения
-        rule_type = {
-            'BAN': '🚫 Бан',
-            'NOTIFY': '⚠️ Уведомление',
-            'OBSERVE': '👀 Слежение'
-        }.get(rule['type'], rule['type'])
-        
-        text = (
-            f"Редактирование правила:\n\n"
-            f"Тип: {rule_type}\n"
-            f"Правило: {rule['rule_text']}\n"
-            f"Объяснение: {rule['explanation_text'] if rule['explanation_text'] else 'Нет'}\n\n"
-            f"Выберите, что хотите изменить:"
-        )
-        
-        # Создаем клавиатуру с кнопками редактирования
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="◀️ Назад", callback_data=f"view_rule:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Тип", callback_data=f"edit_rule_type:{rule_id}"),
-                InlineKeyboardButton(text="📝 Правило", callback_data=f"edit_rule_text:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Объяснение", callback_data=f"edit_rule_explanation:{rule_id}"),
-            ]
-        ])
-        
+        text, markup = self._render_edit_rule(rule)
         await message.answer(text, reply_markup=markup)
 
     async def handle_rule_explanation_edit(self, message: types.Message, state: FSMContext):
@@ -1774,10 +1831,12 @@ class TelegramBot:
             return
             
         new_explanation = message.text
-        rule = await self.db.get_rule_details(rule_id)
+        rule = await self._cached_rule(rule_id)
         
         # Обновляем объяснение правила
         await self.db.update_rule(rule_id, rule['rule_text'], new_explanation, rule['type'])
+        self.invalidate_rule(rule_id)
+        rule['explanation_text'] = new_explanation
         
         # Возвращаемся к редактированию
         await state.clear()
@@ -1785,53 +1844,17 @@ class TelegramBot:
         # Отправляем сообщение об успешном обновлении с меню
         await message.answer("✅ Объяснение правила успешно обновлено", reply_markup=ADMIN_MENU)
         
-        # Получаем информацию о правиле
-        rule = await self.db.get_rule_details(rule_id)
-        
-        # Формируем текст сообщения
-        rule_type = {
-            'BAN': '🚫 Бан',
-            'NOTIFY': '⚠️ Уведомление',
-            'OBSERVE': '👀 Слежение'
-        }.get(rule['type'], rule['type'])
-        
-        text = (
-            f"Редактирование правила:\n\n"
-            f"Тип: {rule_type}\n"
-            f"Правило: {rule['rule_text']}\n"
-            f"Объяснение: {rule['explanation_text'] if rule['explanation_text'] else 'Нет'}\n\n"
-            f"Выберите, что хотите изменить:"
-        )
-        
-        # Создаем клавиатуру с кнопками редактирования
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="◀️ Назад", callback_data=f"view_rule:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Тип", callback_data=f"edit_rule_type:{rule_id}"),
-                InlineKeyboardButton(text="📝 Правило", callback_data=f"edit_rule_text:{rule_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📝 Объяснение", callback_data=f"edit_rule_explanation:{rule_id}"),
-            ]
-        ])
-        
+        text, markup = self._render_edit_rule(rule)
         await message.answer(text, reply_markup=markup)
 
     async def handle_recent_violations_entry(self, message: types.Message, state: FSMContext):
         """Обработчик входа в раздел последних нарушений."""
-        keyboard = [
-            [InlineKeyboardButton(text="Бан", callback_data="violation_type:BAN")],
-            [InlineKeyboardButton(text="Предупреждение", callback_data="violation_type:NOTIFY")]
-        ]
-        
-        # Добавляем кнопку "Наблюдение" только для администраторов
+        # Кнопка "Наблюдение" есть только в клавиатуре для администраторов
         user_role = await self.get_user_role(message.from_user.id)
         if user_role == UserRole.ADMIN:
-            keyboard.append([InlineKeyboardButton(text="Наблюдение", callback_data="violation_type:OBSERVE")])
-            
-        markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+            markup = _VIOLATION_TYPE_ADMIN_MARKUP
+        else:
+            markup = _VIOLATION_TYPE_BASE_MARKUP
         await message.answer("Выберите тип нарушения:", reply_markup=markup)
         await state.set_state(BotStates.waiting_for_violation_type)
 
@@ -1847,68 +1870,63 @@ class TelegramBot:
             return
             
         violations_found = False
-        # Получаем последние нарушения для каждого чата
-        for chat in moderator_chats:
-            # Получаем last_seen_timestamp для каждого правила
-            rules = await self.db.get_rules_for_chat(chat['id'], 0, 100)  # Получаем все правила
-            rules = [r for r in rules if r['type'] == violation_type]  # Фильтруем по типу
+        # Роль не меняется по ходу обработки, кнопку "Наблюдение" определяем один раз
+        is_admin = await self.get_user_role(user_id) == UserRole.ADMIN
+        # Правила нужного типа во всех чатах модератора вместе с last_seen - одним запросом
+        rules = await self.db.get_rules_with_last_seen(user_id, [chat['id'] for chat in moderator_chats], violation_type)
+        for rule in rules:
+            last_seen = rule['last_seen'] or datetime.min
             
-            for rule in rules:
-                last_seen = await self.db.get_last_seen(user_id, rule['id'])
-                if last_seen is None:
-                    last_seen = datetime.min
-                
-                # Получаем новые нарушения
-                violations = await self.db.get_new_violations_per_user(rule['id'], last_seen)
-                if not violations:
+            # Получаем новые нарушения
+            violations = await self.db.get_new_violations_per_user(rule['id'], last_seen)
+            if not violations:
+                continue
+            
+            violations_found = True
+            # Отправляем сообщение нарушителя
+            for violation in violations:
+                violator_msg = await self.db.get_violator_message(violation['violator_msg_id'])
+                if not violator_msg:
                     continue
-                
-                violations_found = True
-                # Отправляем сообщение нарушителя
-                for violation in violations:
-                    violator_msg = await self.db.get_violator_message(violation['violator_msg_id'])
-                    if not violator_msg:
-                        continue
-                        
-                    # Пересылаем сообщение нарушителя
-                    try:
-                        await query.message.answer(
-                            "Сообщение нарушителя:"
-                        )
-                        await self.bot.forward_message(
-                            query.from_user.id,
-                            violator_msg['chat_id'],
-                            violator_msg['post_id']
-                        )
-                    except Exception as e:
-                        print(f"[DEBUG] Failed to forward message: {e}")
-                        # Если не удалось переслать, отправляем текст
-                        await query.message.answer(
-                            f"Сообщение нарушителя:\n{violator_msg['text']}"
-                        )
-                    
-                    # Отправляем информацию о правиле и кнопки действий
-                    keyboard = []
-                    if rule['type'] == 'NOTIFY':
-                        keyboard.append([InlineKeyboardButton(text="Забанить", callback_data=f"violation_action:{violation['id']}:BAN")])
-                    else:
-                        keyboard.append([InlineKeyboardButton(text="Разбанить", callback_data=f"violation_action:{violation['id']}:UNBAN")])
                     
-                    # Добавляем кнопку "Наблюдение" только для администраторов
-                    user_role = await self.get_user_role(user_id)
-                    if user_role == UserRole.ADMIN:
-                        keyboard.append([InlineKeyboardButton(text="Наблюдение", callback_data=f"violation_action:{violation['id']}:WATCH")])
-                    
-                    markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+                # Пересылаем сообщение нарушителя
+                try:
                     await query.message.answer(
-                        f"Тип правила: {rule['type']}\n"
-                        f"Текст правила: {rule['rule_text']}",
-                        reply_markup=markup
+                        "Сообщение нарушителя:"
                     )
-                    
-                    # Обновляем last_seen_timestamp
-                    await self.db.set_last_seen(user_id, rule['id'], violation['detected_at'])
-        
+                    await self.bot.forward_message(
+                        query.from_user.id,
+                        violator_msg['chat_id'],
+                        violator_msg['post_id']
+                    )
+                except Exception as e:
+                    logger.error("Failed to forward message: %s", e)
+                    # Если не удалось переслать, отправляем текст
+                    await query.message.answer(
+                        f"Сообщение нарушителя:\n{violator_msg['text']}"
+                    )
+                
+                # Отправляем информацию о правиле и кнопки действий
+                keyboard = []
+                if rule['type'] == 'NOTIFY':
+                    keyboard.append([InlineKeyboardButton(text="Забанить", callback_data=f"violation_action:{violation['id']}:BAN")])
+                else:
+                    keyboard.append([InlineKeyboardButton(text="Разбанить", callback_data=f"violation_action:{violation['id']}:UNBAN")])
+                
+                # Добавляем кнопку "Наблюдение" только для администраторов
+                if is_admin:
+                    keyboard.append([InlineKeyboardButton(text="Наблюдение", callback_data=f"violation_action:{violation['id']}:WATCH")])
+                
+                markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+                await query.message.answer(
+                    f"Тип правила: {rule['type']}\n"
+                    f"Текст правила: {rule['rule_text']}",
+                    reply_markup=markup
+                )
+                
+                # Обновляем last_seen_timestamp
+                await self.db.set_last_seen(user_id, rule['id'], violation['detected_at'])
+    
         if not violations_found:
             await query.message.edit_text(f"Новых нарушений типа {violation_type} не найдено.")
                     
@@ -1944,7 +1962,7 @@ class TelegramBot:
             elif action == 'UNBAN':
                 await self.bot.unban_chat_member(violation['chat_id'], violation['violator_id'])
         except Exception as e:
-            print(f"[DEBUG] Failed to {action.lower()} user: {e}")
+            logger.error("Failed to %s user: %s", action.lower(), e)
             await query.answer(f"Не удалось {action.lower()} пользователя: {str(e)}")
             return
         
@@ -1967,26 +1985,27 @@ class TelegramBot:
 
     async def handle_message_monitoring(self, message: types.Message):
         """Обработчик мониторинга сообщений в чате."""
-        print(f"[DEBUG] ====== Start processing message {message.message_id} ======")
-        print(f"[DEBUG] Message received in chat {message.chat.id} ({message.chat.title})")
-        print(f"[DEBUG] Message type: {message.content_type}")
-        print(f"[DEBUG] Has video: {bool(message.video)}")
-        print(f"[DEBUG] Has photo: {bool(message.photo)}")
-        print(f"[DEBUG] Has audio: {bool(message.audio)}")
-        print(f"[DEBUG] Has voice: {bool(message.voice)}")
-        print(f"[DEBUG] Text: {message.text or message.caption or 'None'}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("====== Start processing message %s ======", message.message_id)
+            logger.debug("Message received in chat %s (%s)", message.chat.id, message.chat.title)
+            logger.debug("Message type: %s", message.content_type)
+            logger.debug("Has video: %s", bool(message.video))
+            logger.debug("Has photo: %s", bool(message.photo))
+            logger.debug("Has audio: %s", bool(message.audio))
+            logger.debug("Has voice: %s", bool(message.voice))
+            logger.debug("Text: %s", message.text or message.caption or 'None')
         
         # Проверяем, что бот имеет права на чтение сообщений
         chat = await self.db.get_chat(message.chat.id)
         if not chat or not chat['can_read_messages']:
-            print(f"[DEBUG] Skipping message - no read permissions or chat not found")
+            logger.debug("Skipping message - no read permissions or chat not found")
             return
 
         # Добавляем информацию о пользователе
         username = message.from_user.username
         full_name = message.from_user.full_name
         await self.db.add_or_update_user(message.from_user.id, username, full_name)
-        print(f"[DEBUG] User info added/updated: id={message.from_user.id}, username={username}, full_name={full_name}")
+        logger.debug("User info added/updated: id=%s, username=%s, full_name=%s", message.from_user.id, username, full_name)
 
         # Собираем информацию о медиа в сообщении
         media_info = {
@@ -2000,98 +2019,68 @@ class TelegramBot:
             'image_uuids': [],
             'audio_uuids': []
         }
-        print(f"[DEBUG] Initial media_info: {media_info}")
+        logger.debug("Initial media_info: %s", media_info)
 
         # Обработка видео
         if message.video:
-            print(f"[DEBUG] Processing video message")
-            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
+            logger.debug("Processing video message")
+            # Файл удаляется при выходе из контекста, даже если обработка упала
+            with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
                 video_path = temp_file.name
-                try:
-                    print(f"[DEBUG] Downloading video to {video_path}")
-                    # Получаем файл и скачиваем его
-                    file = await self.bot.get_file(message.video.file_id)
-                    await self.bot.download_file(file.file_path, video_path)
-                    
-                    # Извлекаем кадр и аудио
-                    frame_data = await self.extract_video_frame(video_path)
-                    audio_data = await self.extract_video_audio(video_path)
-                    
-                    # Сохраняем в БД
-                    frame_uuid = await self.db.store_image(frame_data)
-                    audio_uuid = await self.db.store_audio(audio_data)
-                    
-                    media_info['image_uuids'].append(frame_uuid)
-                    media_info['audio_uuids'].append(audio_uuid)
-                finally:
-                    if os.path.exists(video_path):
-                        os.unlink(video_path)
+                logger.debug("Downloading video to %s", video_path)
+                # Получаем файл и скачиваем его
+                file = await self.bot.get_file(message.video.file_id)
+                await self.bot.download_file(file.file_path, video_path)
+                
+                # Извлекаем кадр и аудио и сохраняем их в БД
+                frame_uuid, audio_uuid = await self.process_video(
+                    video_path, message.video.duration
+                )
+                
+                media_info['image_uuids'].append(frame_uuid)
+                media_info['audio_uuids'].append(audio_uuid)
 
         # Обработка фото
         if message.photo:
             for photo in message.photo:
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                    temp_path = temp_file.name
-                    try:
-                        # Получаем файл и скачиваем его
-                        file = await self.bot.get_file(photo.file_id)
-                        await self.bot.download_file(file.file_path, temp_path)
-                        # Читаем файл
-                        with open(temp_path, 'rb') as f:
-                            photo_data = f.read()
-                        # Сохраняем в БД
-                        photo_uuid = await self.db.store_image(photo_data)
-                        media_info['image_uuids'].append(photo_uuid)
-                    finally:
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
+                # Скачиваем файл сразу в память, минуя диск
+                file = await self.bot.get_file(photo.file_id)
+                photo_data = await self.bot.download_file(file.file_path)
+                # Сохраняем в БД: getbuffer() отдаёт asyncpg буфер без копии всего файла
+                photo_uuid = await self.db.store_image(photo_data.getbuffer())
+                media_info['image_uuids'].append(photo_uuid)
 
         # Обработка аудио/голосовых сообщений
         if message.audio or message.voice:
             audio = message.audio or message.voice
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                temp_path = temp_file.name
-                try:
-                    # Получаем файл и скачиваем его
-                    file = await self.bot.get_file(audio.file_id)
-                    await self.bot.download_file(file.file_path, temp_path)
-                    # Читаем файл
-                    with open(temp_path, 'rb') as f:
-                        audio_data = f.read()
-                    # Сохраняем в БД
-                    audio_uuid = await self.db.store_audio(audio_data)
-                    media_info['audio_uuids'].append(audio_uuid)
-                finally:
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
-
-        # Отправляем информацию в соответствующие очереди
+            # Скачиваем файл сразу в память, минуя диск
+            file = await self.bot.get_file(audio.file_id)
+            audio_data = await self.bot.download_file(file.file_path)
+            # Сохраняем в БД без промежуточной копии
+            audio_uuid = await self.db.store_audio(audio_data.getbuffer())
+            media_info['audio_uuids'].append(audio_uuid)
+
+        # Все очереди получают одно и то же тело, сериализуем его один раз
+        routing_keys = []
         if media_info['image_uuids']:
-            await self.rabbitmq_channel.default_exchange.publish(
-                aio_pika.Message(body=json.dumps({
-                    **media_info,
-                    'image_uuids': [str(uuid) for uuid in media_info['image_uuids']],
-                    'audio_uuids': [str(uuid) for uuid in media_info['audio_uuids']]
-                }).encode()),
-                routing_key="multimedia.images"
-            )
-
+            routing_keys.append("multimedia.images")
         if media_info['audio_uuids']:
-            await self.rabbitmq_channel.default_exchange.publish(
-                aio_pika.Message(body=json.dumps({
-                    **media_info,
-                    'image_uuids': [str(uuid) for uuid in media_info['image_uuids']],
-                    'audio_uuids': [str(uuid) for uuid in media_info['audio_uuids']]
-                }).encode()),
-                routing_key="multimedia.audio"
-            )
-
+            routing_keys.append("multimedia.audio")
         if media_info['text']:
-            await self.rabbitmq_channel.default_exchange.publish(
-                aio_pika.Message(body=json.dumps({
-                    **media_info,
-                    'image_uuids': [str(uuid) for uuid in media_info['image_uuids']],
-                    'audio_uuids': [str(uuid) for uuid in media_info['audio_uuids']]
-                }).encode()),
-                routing_key="multimedia.text"
-            )
\ No newline at end of file
+            routing_keys.append("multimedia.text")
+        if not routing_keys:
+            return
+        body = orjson.dumps({
+            **media_info,
+            'image_uuids': [str(uuid) for uuid in media_info['image_uuids']],
+            'audio_uuids': [str(uuid) for uuid in media_info['audio_uuids']]
+        })
+
+        # Отправляем информацию в соответствующие очереди одной пачкой
+        if not self._queues_ready:
+            await self._ensure_queues()
+        async with self.channel_pool.acquire() as channel:
+            await asyncio.gather(*(
+                channel.default_exchange.publish(aio_pika.Message(body=body), routing_key=routing_key)
+                for routing_key in routing_keys
+            ))
\ No newline at end of file
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import FrozenSet, Optional
 import yaml
 
 
@@ -12,7 +12,11 @@ class TelegramConfig:
 
 @dataclass
 class AdminConfig:
-    sysadmin_ids: List[int]
+    sysadmin_ids: FrozenSet[int]
+
+    def __post_init__(self):
+        # Проверка на сисадмина идёт на каждое сообщение, поэтому храним множество
+        self.sysadmin_ids = frozenset(self.sysadmin_ids or ())
 
 
 @dataclass
@@ -23,6 +27,7 @@ class QueueConfig:
     username: str
     password: str
     vhost: str
+    prefetch: Optional[int] = None
 
 
 @dataclass
@@ -37,6 +42,8 @@ class PostgresConfig:
     db: str
     user: str
     password: str
+    pool_min: int = 5
+    pool_max: int = 50
 
 
 @dataclass
@@ -15,6 +15,35 @@ RULE_TYPE_OBSERVE = 'OBSERVE'
 DECISION_BAN = 'BAN'
 DECISION_WARN = 'WARN'
 
+# Горячие запросы хендлеров: готовятся один раз на каждом соединении пула
+PREPARED_STATEMENTS = {
+    'role_flags': (
+        'SELECT '
+        'EXISTS(SELECT 1 FROM chat_admins a JOIN chats c ON c.id = a.chat_id '
+        'WHERE a.user_id = $1 AND a.activated = TRUE AND c.activated = TRUE) AS is_admin, '
+        'EXISTS(SELECT 1 FROM chat_moderators m JOIN chats c ON c.id = m.chat_id '
+        'WHERE m.user_id = $1 AND m.activated = TRUE AND c.activated = TRUE) AS is_moderator'
+    ),
+    'moderator_statuses': (
+        'SELECT chat_id, activated FROM chat_moderators WHERE user_id = $1 AND chat_id = ANY($2::bigint[])'
+    ),
+    'is_active_admin': (
+        'SELECT 1 FROM chat_admins WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE'
+    ),
+    'is_active_moderator': (
+        'SELECT 1 FROM chat_moderators WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE'
+    ),
+    'remove_active_admin': (
+        'DELETE FROM chat_admins WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE RETURNING TRUE'
+    ),
+}
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Соединение пула с подготовленными PREPARED_STATEMENTS в атрибуте prepared."""
+    prepared: Dict[str, asyncpg.prepared_stmt.PreparedStatement]
+
+
 class Database:
     def __init__(self, config):
         self.config = config
@@ -27,8 +56,22 @@ class Database:
             user=self.config.postgres.user,
             password=self.config.postgres.password,
             database=self.config.postgres.db,
+            # Держим тёплые соединения, чтобы колбэки не платили за установку соединения
+            min_size=self.config.postgres.pool_min,
+            max_size=self.config.postgres.pool_max,
+            max_inactive_connection_lifetime=300,
+            # Запросов в боте много и все они статичны - кэшируем подготовленные выражения без срока
+            statement_cache_size=1024,
+            max_cached_statement_lifetime=0,
+            connection_class=PreparedConnection,
+            init=self._prepare_statements
         )
 
+    @staticmethod
+    async def _prepare_statements(conn: PreparedConnection) -> None:
+        """Готовит горячие запросы на новом соединении пула."""
+        conn.prepared = {name: await conn.prepare(sql) for name, sql in PREPARED_STATEMENTS.items()}
+
     async def close(self):
         if self.pool:
             await self.pool.close()
@@ -50,6 +93,57 @@ class Database:
                 chat_id, title, activated, can_read_messages, can_restrict_members, is_bot_in
             )
 
+    async def toggle_chat_activated(self, chat_id: int) -> Optional[Tuple[bool, str]]:
+        """Переключает активность чата одним запросом. Возвращает (новый статус, название) или None, если чата нет."""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                'UPDATE chats SET activated = activated IS NOT TRUE WHERE id = $1 RETURNING activated, title',
+                chat_id
+            )
+            return (row['activated'], row['title']) if row else None
+
+    async def activate_chat_if_inactive(self, chat_id: int, title: str) -> bool:
+        """Активирует чат одним запросом. Возвращает False, если чат уже был активирован."""
+        async with self.pool.acquire() as conn:
+            activated = await conn.fetchval(
+                'INSERT INTO chats (id, title, activated, can_read_messages, can_restrict_members, is_bot_in) '
+                'VALUES ($1, $2, TRUE, FALSE, FALSE, TRUE) '
+                'ON CONFLICT (id) DO UPDATE '
+                'SET title = $2, activated = TRUE, can_read_messages = FALSE, can_restrict_members = FALSE, is_bot_in = TRUE '
+                'WHERE chats.activated IS NOT TRUE '
+                'RETURNING TRUE',
+                chat_id, title
+            )
+            return bool(activated)
+
+    async def get_admin_status_matrix(self, user_id: int, offset: int, limit: int) -> Tuple[List[Dict], bool]:
+        """Возвращает страницу чатов с ботом со статусом пользователя как админа и признак следующей страницы."""
+        async with self.pool.acquire() as conn:
+            # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+            rows = await conn.fetch(
+                'SELECT c.id, c.title, COALESCE(a.activated, FALSE) AS activated '
+                'FROM chats c '
+                'LEFT JOIN chat_admins a ON a.chat_id = c.id AND a.user_id = $1 '
+                'WHERE c.is_bot_in = TRUE '
+                'ORDER BY c.id '
+                'LIMIT $2 OFFSET $3',
+                user_id, limit + 1, offset
+            )
+            return [{'chat_id': r['id'], 'title': r['title'], 'active': r['activated']} for r in rows[:limit]], len(rows) > limit
+
+    async def get_bot_chats_count(self) -> int:
+        """Возвращает количество чатов, в которых есть бот."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval('SELECT COUNT(*) FROM chats WHERE is_bot_in = TRUE')
+
+    async def is_bot_chat(self, chat_id: int) -> bool:
+        """Проверяет, что чат известен и бот в нём состоит."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                'SELECT EXISTS(SELECT 1 FROM chats WHERE id = $1 AND is_bot_in = TRUE)',
+                chat_id
+            )
+
     async def update_chat_status(self, chat_id: int, activated: bool) -> None:
         """Обновляет статус чата."""
         async with self.pool.acquire() as conn:
@@ -138,6 +232,17 @@ class Database:
             )
             return [{'id': r['id'], 'title': r['title']} for r in rows]
 
+    async def get_admin_chat(self, user_id: int, chat_id: int) -> Optional[Dict]:
+        """Возвращает чат с ботом, если пользователь в нём админ, иначе None."""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                'SELECT c.id, c.title FROM chats c '
+                'JOIN chat_admins a ON c.id = a.chat_id '
+                'WHERE a.user_id = $1 AND c.id = $2 AND c.is_bot_in = TRUE',
+                user_id, chat_id
+            )
+            return {'id': row['id'], 'title': row['title']} if row else None
+
     async def remove_admin_from_all_chats(self, user_id):
         async with self.pool.acquire() as conn:
             await conn.execute(
@@ -189,6 +294,20 @@ class Database:
                 user_id, username, full_name
             )
 
+    async def bulk_add_admins_with_users(self, chat_id: int, admins: List[Tuple[int, Optional[str], str]]) -> None:
+        """Сохраняет пользователей (user_id, username, full_name) и добавляет их неактивными админами чата одной транзакцией."""
+        async with self.pool.acquire() as conn, conn.transaction():
+            await conn.executemany(
+                'INSERT INTO users (user_id, username, full_name) VALUES ($1, $2, $3) '
+                'ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username, full_name = EXCLUDED.full_name',
+                admins
+            )
+            await conn.executemany(
+                'INSERT INTO chat_admins (chat_id, user_id, activated) VALUES ($1, $2, FALSE) '
+                'ON CONFLICT (chat_id, user_id) DO UPDATE SET activated = FALSE',
+                [(chat_id, user_id) for user_id, _, _ in admins]
+            )
+
     async def get_all_users(self, offset: int, limit: int) -> List[Dict]:
         """Возвращает список всех активных администраторов с пейджингом."""
         async with self.pool.acquire() as conn:
@@ -218,10 +337,26 @@ class Database:
             row = await conn.fetchrow('SELECT 1 FROM users WHERE user_id = $1', user_id)
             return row is not None
 
-    async def get_all_chats(self):
+    async def get_chats_page(self, offset: int, limit: int, activated_only: bool = False) -> Tuple[List[Dict], bool]:
+        """Возвращает страницу чатов и признак наличия следующей страницы."""
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch('SELECT id, title, activated FROM chats')
-            return [{'id': r['id'], 'title': r['title'], 'activated': r['activated']} for r in rows]
+            # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+            rows = await conn.fetch(
+                'SELECT id, title, activated FROM chats '
+                'WHERE ($3 = FALSE OR activated = TRUE) '
+                'ORDER BY id '
+                'LIMIT $1 OFFSET $2',
+                limit + 1, offset, activated_only
+            )
+            return [{'id': r['id'], 'title': r['title'], 'activated': r['activated']} for r in rows[:limit]], len(rows) > limit
+
+    async def get_chats_count(self, activated_only: bool = False) -> int:
+        """Возвращает количество чатов (только активированных, если activated_only)."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                'SELECT COUNT(*) FROM chats WHERE ($1 = FALSE OR activated = TRUE)',
+                activated_only
+            )
 
     async def add_moderator(self, chat_id, user_id, activated=True):
         """Добавляет модератора в чат."""
@@ -268,11 +403,21 @@ class Database:
     async def user_is_admin_in_chat(self, user_id, chat_id):
         """Проверяет, что пользователь активный админ в чате."""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT 1 FROM chat_admins WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE',
-                chat_id, user_id
+            return await conn.prepared['is_active_admin'].fetchval(chat_id, user_id) is not None
+
+    async def toggle_moderator_if_admin(self, admin_user_id: int, moderator_user_id: int, chat_id: int) -> Optional[bool]:
+        """Переключает статус модератора в чате, если инициатор - активный админ этого чата.
+        Возвращает новый статус или None, если прав нет."""
+        async with self.pool.acquire() as conn:
+            # Проверка прав и переключение - одним запросом: без прав SELECT не даёт строк и upsert ничего не делает
+            return await conn.fetchval(
+                'INSERT INTO chat_moderators (chat_id, user_id, activated) '
+                'SELECT $1, $2, TRUE WHERE EXISTS('
+                'SELECT 1 FROM chat_admins WHERE chat_id = $1 AND user_id = $3 AND activated = TRUE) '
+                'ON CONFLICT (chat_id, user_id) DO UPDATE SET activated = chat_moderators.activated IS NOT TRUE '
+                'RETURNING activated',
+                chat_id, moderator_user_id, admin_user_id
             )
-            return row is not None
 
     async def get_user_moderator_chats(self, user_id):
         """Возвращает чаты, где пользователь является активным модератором."""
@@ -285,6 +430,47 @@ class Database:
             )
             return [{'id': r['id'], 'title': r['title']} for r in rows]
 
+    async def get_moderator_or_admin_chats(self, user_id):
+        """Возвращает чаты, где пользователь активный модератор, а если таких нет - где он активный админ."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                'WITH m AS ('
+                '    SELECT c.id, c.title FROM chats c '
+                '    JOIN chat_moderators cm ON c.id = cm.chat_id '
+                '    WHERE cm.user_id = $1 AND cm.activated = TRUE AND c.activated = TRUE'
+                ') '
+                'SELECT id, title FROM m '
+                'UNION ALL '
+                'SELECT c.id, c.title FROM chats c '
+                'JOIN chat_admins a ON c.id = a.chat_id '
+                'WHERE a.user_id = $1 AND a.activated = TRUE AND c.activated = TRUE '
+                'AND NOT EXISTS (SELECT 1 FROM m)',
+                user_id
+            )
+            return [{'id': r['id'], 'title': r['title']} for r in rows]
+
+    async def get_role_flags(self, user_id: int) -> Tuple[bool, bool]:
+        """Возвращает (является ли активным админом, является ли активным модератором) одним запросом."""
+        async with self.pool.acquire() as conn:
+            row = await conn.prepared['role_flags'].fetchrow(user_id)
+            return row['is_admin'], row['is_moderator']
+
+    async def get_moderator_statuses(self, user_id: int, chat_ids: List[int]) -> Dict[int, bool]:
+        """Возвращает статус модератора по каждому из переданных чатов одним запросом."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.prepared['moderator_statuses'].fetch(user_id, chat_ids)
+            return {r['chat_id']: r['activated'] for r in rows}
+
+    async def user_is_moderator_in_chat(self, user_id: int, chat_id: int) -> bool:
+        """Проверяет, что пользователь активный модератор в чате."""
+        async with self.pool.acquire() as conn:
+            return await conn.prepared['is_active_moderator'].fetchval(chat_id, user_id) is not None
+
+    async def remove_active_admin(self, chat_id: int, user_id: int) -> bool:
+        """Удаляет пользователя из активных админов чата. Возвращает False, если активной записи не было."""
+        async with self.pool.acquire() as conn:
+            return bool(await conn.prepared['remove_active_admin'].fetchval(chat_id, user_id))
+
     async def get_moderators_count(self) -> int:
         """Возвращает общее количество активных модераторов."""
         async with self.pool.acquire() as conn:
@@ -306,12 +492,14 @@ class Database:
             )
             return row['id']
 
-    async def get_rules_for_chat(self, chat_id: int, offset: int, limit: int) -> List[Dict]:
-        """Возвращает список правил для чата с пейджингом."""
+    async def get_rules_page(self, chat_id: int, offset: int, limit: int) -> Tuple[List[Dict], int]:
+        """Возвращает страницу активных правил чата и общее число активных правил."""
         async with self.pool.acquire() as conn:
+            # COUNT(*) OVER () считается после GROUP BY - это число правил, а не нарушений
             rows = await conn.fetch(
                 'SELECT r.id, r.rule_text, r.explanation_text, r.type, r.activated, '
-                'COUNT(rv.id) as violation_count '
+                'COUNT(rv.id) as violation_count, '
+                'COUNT(*) OVER () AS total '
                 'FROM rules r '
                 'LEFT JOIN rule_violations rv ON r.id = rv.rule_id '
                 'WHERE r.chat_id = $1 AND r.activated = TRUE '
@@ -326,6 +514,7 @@ class Database:
                 'LIMIT $2 OFFSET $3',
                 chat_id, limit, offset
             )
+            total = rows[0]['total'] if rows else 0
             return [{
                 'id': r['id'],
                 'rule_text': r['rule_text'],
@@ -333,15 +522,7 @@ class Database:
                 'type': r['type'],
                 'activated': r['activated'],
                 'violation_count': r['violation_count']
-            } for r in rows]
-
-    async def get_rules_count_for_chat(self, chat_id: int) -> int:
-        """Возвращает количество активных правил в чате."""
-        async with self.pool.acquire() as conn:
-            return await conn.fetchval(
-                'SELECT COUNT(*) FROM rules WHERE chat_id = $1 AND activated = TRUE',
-                chat_id
-            )
+            } for r in rows], total
 
     async def get_rule_details(self, rule_id: int) -> Dict:
         """Возвращает детальную информацию о правиле."""
@@ -523,43 +704,59 @@ class Database:
                 'chat_title': row['chat_title']
             }
 
-    async def get_chat_decisions(self, chat_id: int, offset: int, limit: int, moderator_id: Optional[int] = None) -> List[Dict]:
-        """Получает решения по нарушениям для чата."""
+    async def get_chat_decisions_with_role(self, chat_id: int, user_id: int, offset: int, limit: int) -> Tuple[bool, List[Dict]]:
+        """Возвращает (является ли пользователь модератором чата, решения по нарушениям) одним запросом.
+
+        Модератору возвращаются только его решения, остальным - все решения в чате.
+        """
         query = """
-            SELECT 
-                rvd.id,
-                rvd.rule_violation_id,
-                rvd.moderator_id,
-                rvd.timestamp,
-                rvd.decision,
-                u.username as moderator_username,
-                u.full_name as moderator_full_name,
-                rv.rule_id,
-                r.rule_text,
-                vm.violator_id,
-                vm.text as message_text,
-                vm.timestamp as message_timestamp,
-                vu.username as violator_username,
-                vu.full_name as violator_full_name
-            FROM rule_violation_decision rvd
-            JOIN users u ON rvd.moderator_id = u.user_id
-            JOIN rule_violations rv ON rvd.rule_violation_id = rv.id
-            JOIN rules r ON rv.rule_id = r.id
-            JOIN violator_messages vm ON rv.violator_msg_id = vm.id
-            JOIN users vu ON vm.violator_id = vu.user_id
-            WHERE r.chat_id = $1
+            WITH is_mod AS (
+                SELECT EXISTS(
+                    SELECT 1 FROM chat_moderators
+                    WHERE chat_id = $1 AND user_id = $2 AND activated = TRUE
+                ) AS m
+            )
+            SELECT is_mod.m AS is_moderator, d.*
+            FROM is_mod
+            LEFT JOIN LATERAL (
+                SELECT 
+                    rvd.id,
+                    rvd.rule_violation_id,
+                    rvd.moderator_id,
+                    rvd.timestamp,
+                    rvd.decision,
+                    u.username as moderator_username,
+                    u.full_name as moderator_full_name,
+                    rv.rule_id,
+                    r.rule_text,
+                    vm.violator_id,
+                    vm.text as message_text,
+                    vm.timestamp as message_timestamp,
+                    vu.username as violator_username,
+                    vu.full_name as violator_full_name
+                FROM rule_violation_decision rvd
+                JOIN users u ON rvd.moderator_id = u.user_id
+                JOIN rule_violations rv ON rvd.rule_violation_id = rv.id
+                JOIN rules r ON rv.rule_id = r.id
+                JOIN violator_messages vm ON rv.violator_msg_id = vm.id
+                JOIN users vu ON vm.violator_id = vu.user_id
+                WHERE r.chat_id = $1 AND (NOT is_mod.m OR rvd.moderator_id = $2)
+                ORDER BY rvd.timestamp DESC
+                LIMIT $3 OFFSET $4
+            ) d ON TRUE
+            ORDER BY d.timestamp DESC
         """
-        params = [chat_id]
-        
-        if moderator_id:
-            query += " AND rvd.moderator_id = $2"
-            params.append(moderator_id)
-            
-        query += " ORDER BY rvd.timestamp DESC LIMIT $%d OFFSET $%d" % (len(params) + 1, len(params) + 2)
-        params.extend([limit, offset])
-        
-        rows = await self.pool.fetch(query, *params)
-        return [dict(row) for row in rows]
+        rows = await self.pool.fetch(query, chat_id, user_id, limit, offset)
+        # Строка с флагом есть всегда; без решений LEFT JOIN даёт одну строку с NULL вместо решения
+        is_moderator = rows[0]['is_moderator']
+        decisions = []
+        for row in rows:
+            if row['id'] is None:
+                continue
+            decision = dict(row)
+            del decision['is_moderator']
+            decisions.append(decision)
+        return is_moderator, decisions
 
     async def get_chat_decisions_count(self, chat_id: int) -> int:
         """Возвращает количество решений модераторов в чате."""
@@ -1678,22 +1875,19 @@ class Database:
                 moderator_id, policy
             )
 
-    async def get_notification_policy_status(self, moderator_id: int, policy_type: str) -> bool:
-        """Возвращает True, если политика типа (BAN/NOTIFICATION) включена (NOTIFY_*), иначе False. Если записи нет — True."""
-        notify_policy = f'NOTIFY_{policy_type}'
+    async def get_notification_policy_statuses(self, moderator_id: int) -> Dict[str, bool]:
+        """Возвращает статусы политик BAN и NOTIFICATION модератора одним запросом. Если записи нет — политика включена."""
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT 1 FROM rule_violation_notification_policies WHERE moderator_id = $1 AND (policy = $2 OR policy = $3)',
-                moderator_id, notify_policy, f'NOT_NOTIFY_{policy_type}'
-            )
-            if row is None:
-                return True  # По умолчанию включено
-            # Проверяем, какая именно политика стоит
-            row_notify = await conn.fetchrow(
-                'SELECT 1 FROM rule_violation_notification_policies WHERE moderator_id = $1 AND policy = $2',
-                moderator_id, notify_policy
+            rows = await conn.fetch(
+                'SELECT policy FROM rule_violation_notification_policies WHERE moderator_id = $1',
+                moderator_id
             )
-            return bool(row_notify)
+        policies = {r['policy'] for r in rows}
+        # Без записей политика включена; при наличии записи решает NOTIFY_*
+        return {
+            policy_type: f'NOTIFY_{policy_type}' in policies or f'NOT_NOTIFY_{policy_type}' not in policies
+            for policy_type in ('BAN', 'NOTIFICATION')
+        }
 
     async def set_notification_policy_status(self, moderator_id: int, policy_type: str, enabled: bool) -> None:
         """Включает или выключает политику типа (BAN/NOTIFICATION) для модератора."""
@@ -1770,6 +1964,25 @@ class Database:
             )
             return row['last_seen_timestamp'] if row else None
 
+    async def get_rules_with_last_seen(self, moderator_id: int, chat_ids: List[int], rule_type: str) -> List[Dict]:
+        """Возвращает активные правила типа rule_type во всех чатах вместе с last_seen модератора одним запросом."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                'SELECT r.id, r.chat_id, r.rule_text, r.type, ls.last_seen_timestamp '
+                'FROM rules r '
+                'LEFT JOIN moderator_rule_last_seen ls ON ls.rule_id = r.id AND ls.moderator_id = $1 '
+                'WHERE r.chat_id = ANY($2::bigint[]) AND r.type = $3 AND r.activated = TRUE '
+                'ORDER BY r.chat_id, r.id',
+                moderator_id, chat_ids, rule_type
+            )
+            return [{
+                'id': r['id'],
+                'chat_id': r['chat_id'],
+                'rule_text': r['rule_text'],
+                'type': r['type'],
+                'last_seen': r['last_seen_timestamp']
+            } for r in rows]
+
     async def set_last_seen(self, moderator_id: int, rule_id: int, timestamp: datetime) -> None:
         """Устанавливает время последнего просмотра правила модератором.
         Если записи нет - создает новую, если есть - обновляет существующую."""